@@ -1,18 +1,22 @@
 import re
+import csv
 import json
 import time
+import zlib
+import sqlite3
+import hashlib
 import datetime
-from threading import Event
-from typing import Tuple, List, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from queue import Queue
+from threading import Event, Lock, Thread
+from typing import Tuple, List, Dict, Any, Optional, Callable, TYPE_CHECKING
 
-import pytz
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from fastapi.responses import Response, RedirectResponse
 
 from app import schemas
-from app.chain.download import DownloadChain
-from app.chain.media import MediaChain
-from app.chain.subscribe import SubscribeChain
 from app.core.config import settings
 from app.core.context import MediaInfo
 from app.core.metainfo import MetaInfo
@@ -22,6 +26,420 @@ from app.schemas import MediaType
 from app.utils.dom import DomUtils
 from app.utils.http import RequestUtils
 
+if TYPE_CHECKING:
+    from app.chain.download import DownloadChain
+    from app.chain.media import MediaChain
+    from app.chain.subscribe import SubscribeChain
+    from .fetcher import DoubanAsyncFetcher
+
+
+class DoubanMappingIndex:
+    """
+    豆瓣ID -> TMDBID 本地映射索引，使用SQLite存储，识别前优先查询
+    """
+
+    def __init__(self, db_path: Path):
+        self._db_path = db_path
+        self._lock = Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 查询统计
+        self._lookups = 0
+        self._hits = 0
+        self._lookup_time = 0.0
+
+    def __connect(self) -> sqlite3.Connection:
+        if not self._conn:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self._db_path), check_same_thread=False)
+            # 回写频繁，使用WAL减少每次提交的同步开销
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS mapping "
+                               "(doubanid TEXT PRIMARY KEY, tmdbid INTEGER NOT NULL, mtype TEXT) WITHOUT ROWID")
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def lookup(self, doubanid: str, mtype: str = None) -> Optional[int]:
+        """
+        查询TMDBID，类型不一致时视为未命中
+        """
+        with self._lock:
+            start = time.perf_counter()
+            row = self.__connect().execute("SELECT tmdbid, mtype FROM mapping WHERE doubanid = ?",
+                                           (str(doubanid),)).fetchone()
+            self._lookups += 1
+            self._lookup_time += time.perf_counter() - start
+            if not row or (mtype and row[1] and row[1] != mtype):
+                return None
+            self._hits += 1
+            return row[0]
+
+    def put(self, doubanid: str, tmdbid: int, mtype: str = None):
+        """
+        回写远程识别结果
+        """
+        with self._lock:
+            conn = self.__connect()
+            conn.execute("INSERT OR REPLACE INTO mapping (doubanid, tmdbid, mtype) VALUES (?, ?, ?)",
+                         (str(doubanid), int(tmdbid), mtype or ""))
+            conn.commit()
+
+    @staticmethod
+    def __read_rows(source: Path):
+        """
+        读取CSV/JSONL映射文件，返回 (doubanid, tmdbid, mtype)
+        """
+        with open(source, "r", encoding="utf-8-sig", newline="") as f:
+            if source.suffix.lower() in [".jsonl", ".json"]:
+                records = (json.loads(line) for line in f if line.strip())
+            else:
+                sample = f.readline()
+                f.seek(0)
+                if "douban" in sample.lower():
+                    records = csv.DictReader(f)
+                else:
+                    records = ({"doubanid": r[0], "tmdbid": r[1], "mtype": r[2] if len(r) > 2 else ""}
+                               for r in csv.reader(f) if len(r) >= 2)
+            for record in records:
+                doubanid = record.get("doubanid") or record.get("douban_id")
+                tmdbid = record.get("tmdbid") or record.get("tmdb_id") or record.get("tmdb")
+                mtype = record.get("mtype") or record.get("type") or record.get("media_type") or ""
+                if not doubanid or not str(tmdbid or "").strip().isdigit():
+                    continue
+                yield str(doubanid).strip(), int(tmdbid), str(mtype).strip()
+
+    def rebuild(self, source: Path) -> dict:
+        """
+        从映射文件重建索引，写入临时库后整体替换
+        """
+        tmp_path = self._db_path.with_suffix(".tmp")
+        tmp_path.unlink(missing_ok=True)
+        tmp_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(tmp_path))
+        try:
+            conn.execute("CREATE TABLE mapping "
+                         "(doubanid TEXT PRIMARY KEY, tmdbid INTEGER NOT NULL, mtype TEXT) WITHOUT ROWID")
+            batch = []
+            for row in self.__read_rows(source):
+                batch.append(row)
+                if len(batch) >= 5000:
+                    conn.executemany("INSERT OR REPLACE INTO mapping VALUES (?, ?, ?)", batch)
+                    batch = []
+            if batch:
+                conn.executemany("INSERT OR REPLACE INTO mapping VALUES (?, ?, ?)", batch)
+            conn.commit()
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+            tmp_path.replace(self._db_path)
+            for suffix in ["-wal", "-shm"]:
+                Path(f"{self._db_path}{suffix}").unlink(missing_ok=True)
+        return self.stats()
+
+    def stats(self) -> dict:
+        """
+        索引大小与查询耗时统计
+        """
+        with self._lock:
+            count = self.__connect().execute("SELECT COUNT(*) FROM mapping").fetchone()[0]
+            return {
+                "count": count,
+                "size": self._db_path.stat().st_size if self._db_path.exists() else 0,
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "avg_lookup_us": round(self._lookup_time / self._lookups * 10**6, 1) if self._lookups else 0
+            }
+
+
+class DoubanResponseCache:
+    """
+    豆瓣榜单响应文件缓存，内容寻址、zlib压缩，超出容量按LRU淘汰
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int):
+        self._cache_dir = cache_dir
+        self._index_file = cache_dir / "index.json"
+        self._max_size = max_size
+        self._lock = Lock()
+        # key -> {"digest", "size", "timestamp"}，按最近访问排序
+        self._index: OrderedDict = OrderedDict()
+        self.__load_index()
+
+    @property
+    def total_size(self) -> int:
+        """
+        缓存占用大小，相同内容只计算一次
+        """
+        return sum({entry.get("digest"): entry.get("size", 0) for entry in self._index.values()}.values())
+
+    def __load_index(self):
+        try:
+            if self._index_file.exists():
+                entries = json.loads(self._index_file.read_text(encoding="utf-8"))
+                for key, entry in sorted(entries.items(), key=lambda x: x[1].get("atime", 0)):
+                    if self.__blob_path(entry.get("digest")).exists():
+                        self._index[key] = entry
+        except Exception as e:
+            logger.error(f"读取榜单缓存索引失败：{str(e)}")
+            self._index.clear()
+
+    def __save_index(self):
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self._index_file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(self._index, ensure_ascii=False), encoding="utf-8")
+        tmp_file.replace(self._index_file)
+
+    def __blob_path(self, digest: str) -> Path:
+        return self._cache_dir / f"{digest}.z"
+
+    def __release(self, digest: str):
+        """
+        没有其它键引用时删除数据文件
+        """
+        if not any(entry.get("digest") == digest for entry in self._index.values()):
+            self.__blob_path(digest).unlink(missing_ok=True)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        读取缓存，返回 {"data", "timestamp"}
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if not entry:
+                return None
+            try:
+                data = json.loads(zlib.decompress(self.__blob_path(entry.get("digest")).read_bytes()))
+            except Exception as e:
+                logger.error(f"读取榜单缓存失败：{key} {str(e)}")
+                # 数据文件损坏，删除引用它的全部键和文件，不再占用缓存容量
+                digest = entry.get("digest")
+                for corrupt_key in [k for k, v in self._index.items() if v.get("digest") == digest]:
+                    self._index.pop(corrupt_key)
+                self.__blob_path(digest).unlink(missing_ok=True)
+                self.__save_index()
+                return None
+            entry["atime"] = time.time()
+            self._index.move_to_end(key)
+            return {"data": data, "timestamp": entry.get("timestamp", 0)}
+
+    def put(self, key: str, data: Any):
+        """
+        写入缓存并按容量淘汰
+        """
+        blob = zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        digest = hashlib.sha1(blob).hexdigest()
+        with self._lock:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            blob_path = self.__blob_path(digest)
+            if not blob_path.exists():
+                tmp_path = blob_path.with_suffix(".tmp")
+                tmp_path.write_bytes(blob)
+                tmp_path.replace(blob_path)
+            now = time.time()
+            old_entry = self._index.pop(key, None)
+            self._index[key] = {"digest": digest, "size": len(blob), "timestamp": now, "atime": now}
+            if old_entry and old_entry.get("digest") != digest:
+                self.__release(old_entry.get("digest"))
+            # 按最近最少使用淘汰，至少保留当前写入项
+            while len(self._index) > 1 and self.total_size > self._max_size:
+                _, evicted = self._index.popitem(last=False)
+                self.__release(evicted.get("digest"))
+            self.__save_index()
+
+    def flush(self):
+        """
+        保存访问顺序
+        """
+        with self._lock:
+            if self._index:
+                self.__save_index()
+
+
+class DoubanPosterCache:
+    """
+    历史记录海报缩略图本地缓存，超出数量时删除最早的文件
+    """
+
+    # 卡片尺寸
+    _size = (80, 120)
+
+    def __init__(self, cache_dir: Path, max_count: int):
+        self._cache_dir = cache_dir
+        self._max_count = max_count
+        self._lock = Lock()
+
+    def path(self, key: str) -> Optional[Path]:
+        file_path = self._cache_dir / f"{re.sub(r'[^0-9A-Za-z_-]', '', str(key))}.img"
+        return file_path if file_path.exists() else None
+
+    @staticmethod
+    def media_type(content: bytes) -> str:
+        if content.startswith(b"\x89PNG"):
+            return "image/png"
+        if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+            return "image/webp"
+        return "image/jpeg"
+
+    def __resize(self, content: bytes) -> bytes:
+        """
+        缩放至卡片尺寸，未安装Pillow时保存原图
+        """
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            return content
+        with Image.open(BytesIO(content)) as image:
+            thumbnail = ImageOps.fit(image.convert("RGB"), self._size, method=Image.LANCZOS)
+            output = BytesIO()
+            thumbnail.save(output, format="JPEG", quality=85, optimize=True)
+            return output.getvalue()
+
+    def fetch(self, key: str, url: str, proxies: dict = None) -> bool:
+        """
+        下载并缓存海报
+        """
+        if not key or not url or self.path(key):
+            return True
+        try:
+            ret = RequestUtils(proxies=proxies).get_res(url)
+            if not ret or not ret.content:
+                logger.warn(f"下载海报失败：{url}")
+                return False
+            content = self.__resize(ret.content)
+        except Exception as e:
+            logger.error(f"缓存海报失败：{url} {str(e)}")
+            return False
+        file_path = self._cache_dir / f"{re.sub(r'[^0-9A-Za-z_-]', '', str(key))}.img"
+        with self._lock:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = file_path.with_suffix(".tmp")
+            tmp_path.write_bytes(content)
+            tmp_path.replace(file_path)
+            self.__evict()
+        return True
+
+    def __evict(self):
+        files = sorted(self._cache_dir.glob("*.img"), key=lambda f: f.stat().st_mtime)
+        for file_path in files[:max(len(files) - self._max_count, 0)]:
+            file_path.unlink(missing_ok=True)
+
+
+class DoubanPipelineStage:
+    """
+    刷新流水线阶段，多个工作线程从有界队列取数据，输出写入下一阶段队列
+    """
+
+    # 结束标记
+    _sentinel = object()
+
+    def __init__(self, name: str, func: Callable[[Any], list], workers: int, stop_event: Event):
+        self.name = name
+        self.workers = max(int(workers), 1)
+        self._func = func
+        self._stop_event = stop_event
+        self._lock = Lock()
+        self._alive = 0
+        self._in_queue: Optional[Queue] = None
+        self._next: Optional["DoubanPipelineStage"] = None
+        # 统计
+        self.processed = 0
+        self.emitted = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+
+    def start(self, in_queue: Queue, next_stage: Optional["DoubanPipelineStage"]) -> List[Thread]:
+        self._in_queue = in_queue
+        self._next = next_stage
+        self._alive = self.workers
+        threads = [Thread(target=self.__work, name=f"doubanrankmod-{self.name}-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def __work(self):
+        while True:
+            item = self._in_queue.get()
+            if item is self._sentinel:
+                break
+            # 停止后只消费不处理，保证上游不会阻塞
+            if self._stop_event.is_set():
+                continue
+            with self._lock:
+                self.max_depth = max(self.max_depth, self._in_queue.qsize() + 1)
+            start = time.perf_counter()
+            try:
+                outputs = self._func(item) or []
+            except Exception as e:
+                logger.error(f"{self.name}失败：{str(e)}")
+                outputs = []
+            with self._lock:
+                self.busy_time += time.perf_counter() - start
+                self.processed += 1
+                self.emitted += len(outputs)
+            if self._next:
+                for output in outputs:
+                    self._next._in_queue.put(output)
+        with self._lock:
+            self._alive -= 1
+            finished = self._alive == 0
+        # 最后一个工作线程结束时通知下游
+        if finished and self._next:
+            for _ in range(self._next.workers):
+                self._next._in_queue.put(self._sentinel)
+
+    def summary(self, elapsed: float) -> dict:
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "busy_time": round(self.busy_time, 3),
+            "throughput": round(self.processed / elapsed, 2) if elapsed else 0,
+            "max_depth": self.max_depth
+        }
+
+    def report(self, elapsed: float) -> str:
+        summary = self.summary(elapsed)
+        return (f"阶段 {self.name}：并发 {self.workers}，处理 {self.processed} 条，输出 {self.emitted} 条，"
+                f"耗时 {round(self.busy_time, 2)} 秒，吞吐 {summary.get('throughput')} 条/秒，"
+                f"最大队列深度 {self.max_depth}")
+
+    @classmethod
+    def run(cls, stages: List["DoubanPipelineStage"], items: list, queue_size: int,
+            producer: Callable[[Callable[[Any], None]], None] = None):
+        """
+        运行流水线直至全部阶段结束，producer 在当前线程中持续向首阶段投递数据
+        """
+        threads = []
+        # 首阶段输入为全部任务，其余阶段使用有界队列形成背压
+        queues = [Queue()] + [Queue(maxsize=queue_size) for _ in stages[1:]]
+        for index, stage in enumerate(stages):
+            stage._in_queue = queues[index]
+        for index, stage in enumerate(stages):
+            next_stage = stages[index + 1] if index + 1 < len(stages) else None
+            threads.extend(stage.start(queues[index], next_stage))
+        for item in items:
+            queues[0].put(item)
+        if producer:
+            try:
+                producer(queues[0].put)
+            except Exception as e:
+                logger.error(f"{stages[0].name}数据投递失败：{str(e)}")
+        for _ in range(stages[0].workers):
+            queues[0].put(cls._sentinel)
+        for thread in threads:
+            thread.join()
+
 
 class DoubanRankMod(_PluginBase):
     # 插件名称
@@ -31,7 +449,7 @@ class DoubanRankMod(_PluginBase):
     # 插件图标
     plugin_icon = "https://raw.githubusercontent.com/justzerock/MoviePilot-Plugins/main/icons/douban.png"
     # 插件版本
-    plugin_version = "1.7"
+    plugin_version = "2.8"
     # 插件作者
     plugin_author = "justzerock"
     # 作者主页
@@ -46,10 +464,16 @@ class DoubanRankMod(_PluginBase):
     # 退出事件
     _event = Event()
     # 私有属性
-    downloadchain: DownloadChain = None
-    subscribechain: SubscribeChain = None
-    mediachain: MediaChain = None
+    _downloadchain: "DownloadChain" = None
+    _subscribechain: "SubscribeChain" = None
+    _mediachain: "MediaChain" = None
+    _chain_lock = Lock()
+    _cache_lock = Lock()
     _scheduler = None
+    _mapping: DoubanMappingIndex = None
+    _cache: DoubanResponseCache = None
+    _posters: DoubanPosterCache = None
+    _poster_executor: ThreadPoolExecutor = None
     _douban_list = [
         {
             'title':'豆瓣TOP250', 
@@ -114,6 +538,22 @@ class DoubanRankMod(_PluginBase):
     ]
     _cache_duration = 120
     _cache_duration_top250 = 1200
+    _cache_size = 20
+    _poster_count = 500
+    # 流水线并发及队列长度
+    _parse_workers = 2
+    _recognize_workers = 4
+    _check_workers = 2
+    _queue_size = 20
+    _blacklist_options = ["真人秀", "脱口秀", "纪录片", "歌舞", "同性"]
+    # 页面配置缓存 (key, schema)
+    _form_cache: tuple = None
+    _page_cache: tuple = None
+    # 历史记录版本，变更时页面缓存失效
+    _history_version = 0
+    # 历史记录索引 unique -> history
+    _history_index: OrderedDict = None
+    _history_lock = Lock()
     _enabled = False
     _cron = ""
     _onlyonce = False
@@ -132,12 +572,15 @@ class DoubanRankMod(_PluginBase):
     _clear = False
     _clearflag = False
     _proxy = False
+    _mapping_file = ""
+    _douban_api = ""
+    # 榜单独立调度 {榜单ID: {"cron": cron表达式, "ttl": 缓存分钟}}
+    _rank_schedules: Dict[str, dict] = {}
+    _rebuild_mapping = False
+    _dry_run = False
 
     def init_plugin(self, config: dict = None):
-        self.downloadchain = DownloadChain()
-        self.subscribechain = SubscribeChain()
-        self.mediachain = MediaChain()
-
+        start = time.perf_counter()
         if config:
             self._enabled = config.get("enabled")
             self._cron = config.get("cron")
@@ -153,6 +596,10 @@ class DoubanRankMod(_PluginBase):
             self._year_top250 = int(config.get("year_top250")) if config.get("year_top250") else 2020
             self._cache_duration = int(config.get("cache_duration")) if config.get("cache_duration") else 120
             self._cache_duration_top250 = int(config.get("cache_duration_top250")) if config.get("cache_duration_top250") else 1200
+            self._cache_size = int(config.get("cache_size")) if config.get("cache_size") else 20
+            self._poster_count = int(config.get("poster_count")) if config.get("poster_count") else 500
+            workers = [int(w) for w in re.split(r'[,，\s]+', str(config.get("workers") or "")) if w.isdigit()]
+            self._parse_workers, self._recognize_workers, self._check_workers = (workers + [2, 4, 2][len(workers):])[:3]
             self._count = int(config.get("count")) if config.get("count") else 5000
             genre_rate = config.get("genre_rate")
             if genre_rate:
@@ -163,36 +610,124 @@ class DoubanRankMod(_PluginBase):
             else:
                 self._genre_rate = []
             self._douban_ranks = config.get("douban_ranks") or []
+            self._rank_schedules = self.__parse_rank_schedules(config.get("rank_schedule"))
             self._blacklist = config.get("blacklist") or []
             self._clear = config.get("clear")
+            self._mapping_file = config.get("mapping_file") or ""
+            self._douban_api = config.get("douban_api") or ""
+            self._rebuild_mapping = config.get("rebuild_mapping")
+            self._dry_run = config.get("dry_run")
 
         # 停止现有任务
         self.stop_service()
+        self._history_index = None
+
+        # 豆瓣ID映射索引
+        self._mapping = DoubanMappingIndex(self.get_data_path() / "mapping.db")
+        # 榜单响应缓存和海报缩略图缓存首次使用时再创建
+        self._cache = None
+        self._posters = None
+        if not self.get_data("legacy_cache_cleared"):
+            # 清理旧版本保存在插件数据中的榜单缓存，只执行一次
+            for douban_item in self._douban_list:
+                self.del_data(douban_item.get("value"))
+            self.save_data("legacy_cache_cleared", True)
 
         # 启动服务
-        if self._enabled or self._onlyonce:
-            if self._onlyonce:
+        if self._enabled or self._onlyonce or self._rebuild_mapping:
+            if self._onlyonce or self._rebuild_mapping:
+                import pytz
+                from apscheduler.schedulers.background import BackgroundScheduler
                 self._scheduler = BackgroundScheduler(timezone=settings.TZ)
+            if self._rebuild_mapping:
+                logger.info("豆瓣ID映射索引开始重建")
+                self._scheduler.add_job(func=self.__rebuild_mapping, trigger='date',
+                                        run_date=datetime.datetime.now(
+                                            tz=pytz.timezone(settings.TZ)) + datetime.timedelta(seconds=1)
+                                        )
+            if self._onlyonce:
                 logger.info("豆瓣榜单订阅服务启动，立即运行一次")
                 self._scheduler.add_job(func=self.__refresh_rss, trigger='date',
                                         run_date=datetime.datetime.now(
                                             tz=pytz.timezone(settings.TZ)) + datetime.timedelta(seconds=3)
                                         )
 
-                if self._scheduler.get_jobs():
-                    # 启动服务
-                    self._scheduler.print_jobs()
-                    self._scheduler.start()
+            if self._scheduler and self._scheduler.get_jobs():
+                # 启动服务
+                self._scheduler.print_jobs()
+                self._scheduler.start()
 
-            if self._onlyonce or self._clear:
+            if self._onlyonce or self._clear or self._rebuild_mapping:
                 # 关闭一次性开关
                 self._onlyonce = False
+                self._rebuild_mapping = False
                 # 记录缓存清理标志
                 self._clearflag = self._clear
                 # 关闭清理缓存
                 self._clear = False
                 # 保存配置
                 self.__update_config()
+        logger.debug(f"豆瓣榜单插件初始化耗时 {round((time.perf_counter() - start) * 1000, 1)} 毫秒")
+
+    @property
+    def downloadchain(self) -> "DownloadChain":
+        if not self._downloadchain:
+            self.__init_chains()
+        return self._downloadchain
+
+    @property
+    def subscribechain(self) -> "SubscribeChain":
+        if not self._subscribechain:
+            self.__init_chains()
+        return self._subscribechain
+
+    @property
+    def mediachain(self) -> "MediaChain":
+        if not self._mediachain:
+            self.__init_chains()
+        return self._mediachain
+
+    @property
+    def cache(self) -> DoubanResponseCache:
+        if not self._cache:
+            with self._cache_lock:
+                if not self._cache:
+                    self._cache = DoubanResponseCache(self.get_data_path() / "cache",
+                                                      self._cache_size * 1024 * 1024)
+        return self._cache
+
+    @property
+    def posters(self) -> DoubanPosterCache:
+        if not self._posters:
+            with self._cache_lock:
+                if not self._posters:
+                    self._posters = DoubanPosterCache(self.get_data_path() / "posters", self._poster_count)
+        return self._posters
+
+    @property
+    def poster_executor(self) -> ThreadPoolExecutor:
+        if not self._poster_executor:
+            with self._cache_lock:
+                if not self._poster_executor:
+                    self._poster_executor = ThreadPoolExecutor(max_workers=2,
+                                                               thread_name_prefix="doubanrankmod-poster")
+        return self._poster_executor
+
+    def __init_chains(self):
+        """
+        首次刷新时再创建处理链，之后复用
+        """
+        with self._chain_lock:
+            if self._downloadchain and self._subscribechain and self._mediachain:
+                return
+            start = time.perf_counter()
+            from app.chain.download import DownloadChain
+            from app.chain.media import MediaChain
+            from app.chain.subscribe import SubscribeChain
+            self._downloadchain = self._downloadchain or DownloadChain()
+            self._subscribechain = self._subscribechain or SubscribeChain()
+            self._mediachain = self._mediachain or MediaChain()
+            logger.info(f"豆瓣榜单处理链初始化耗时 {round((time.perf_counter() - start) * 1000, 1)} 毫秒")
 
     def get_state(self) -> bool:
         return self._enabled
@@ -217,6 +752,36 @@ class DoubanRankMod(_PluginBase):
                 "endpoint": self.delete_history,
                 "methods": ["GET"],
                 "summary": "删除豆瓣榜单订阅历史记录"
+            },
+            {
+                "path": "/delete_histories",
+                "endpoint": self.delete_histories,
+                "methods": ["POST"],
+                "summary": "批量删除豆瓣榜单订阅历史记录"
+            },
+            {
+                "path": "/dry_run",
+                "endpoint": self.dry_run,
+                "methods": ["GET"],
+                "summary": "模拟运行豆瓣榜单订阅"
+            },
+            {
+                "path": "/poster",
+                "endpoint": self.poster,
+                "methods": ["GET"],
+                "summary": "豆瓣榜单历史记录海报"
+            },
+            {
+                "path": "/rebuild_mapping",
+                "endpoint": self.rebuild_mapping,
+                "methods": ["GET"],
+                "summary": "重建豆瓣ID映射索引"
+            },
+            {
+                "path": "/mapping_stats",
+                "endpoint": self.mapping_stats,
+                "methods": ["GET"],
+                "summary": "豆瓣ID映射索引统计"
             }
         ]
 
@@ -231,29 +796,55 @@ class DoubanRankMod(_PluginBase):
             "kwargs": {} # 定时器参数
         }]
         """
-        if self._enabled and self._cron:
-            return [
-                {
-                    "id": "DoubanRankMod",
-                    "name": "豆瓣榜单订阅服务",
-                    "trigger": CronTrigger.from_crontab(self._cron),
-                    "func": self.__refresh_rss,
-                    "kwargs": {}
-                }
-            ]
-        elif self._enabled:
-            return [
-                {
-                    "id": "DoubanRankMod",
-                    "name": "豆瓣榜单订阅服务",
-                    "trigger": CronTrigger.from_crontab("0 8 * * *"),
-                    "func": self.__refresh_rss,
-                    "kwargs": {}
-                }
-            ]
-        return []
+        if not self._enabled:
+            return []
+        from apscheduler.triggers.cron import CronTrigger
+        services = []
+        # 未单独设置执行周期的榜单共用一个服务
+        shared_ranks = []
+        for douban_item in self._douban_list:
+            rank = douban_item.get("value")
+            if rank not in self._douban_ranks:
+                continue
+            cron = self._rank_schedules.get(rank, {}).get("cron")
+            if not cron:
+                shared_ranks.append(rank)
+                continue
+            try:
+                trigger = CronTrigger.from_crontab(cron)
+            except Exception as e:
+                logger.error(f"榜单 {douban_item.get('title')} 执行周期设置错误：{str(e)}")
+                shared_ranks.append(rank)
+                continue
+            services.append({
+                "id": f"DoubanRankMod_{rank}",
+                "name": f"豆瓣榜单订阅服务（{douban_item.get('title')}）",
+                "trigger": trigger,
+                "func": self.__refresh_rss,
+                "kwargs": {"ranks": [rank]}
+            })
+        if shared_ranks or not self._douban_ranks:
+            services.insert(0, {
+                "id": "DoubanRankMod",
+                "name": "豆瓣榜单订阅服务",
+                "trigger": CronTrigger.from_crontab(self._cron or "0 8 * * *"),
+                "func": self.__refresh_rss,
+                "kwargs": {"ranks": shared_ranks}
+            })
+        return services
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
+        form_key = (self.plugin_version,
+                    tuple((item.get("title"), item.get("value")) for item in self._douban_list),
+                    tuple(self._blacklist_options))
+        if not self._form_cache or self._form_cache[0] != form_key:
+            self._form_cache = (form_key, self.__build_form())
+        return self._form_cache[1]
+
+    def __build_form(self) -> Tuple[List[dict], Dict[str, Any]]:
+        """
+        拼装插件配置页面
+        """
         return [
             {
                 'component': 'VForm',
@@ -503,7 +1094,7 @@ class DoubanRankMod(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -520,7 +1111,7 @@ class DoubanRankMod(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -532,6 +1123,23 @@ class DoubanRankMod(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'cache_size',
+                                            'label': '本地缓存容量（MB）',
+                                            'placeholder': '默认 20'
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -580,6 +1188,29 @@ class DoubanRankMod(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextarea',
+                                        'props': {
+                                            'model': 'rank_schedule',
+                                            'label': '榜单独立调度',
+                                            'placeholder': '每行一个榜单：榜单ID|cron表达式|缓存分钟，留空使用全局设置，如：\n'
+                                                           'subject_real_time_hotest|*/30 * * * *|30\n'
+                                                           'movie_weekly_best|0 9 * * 5|10080'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -597,7 +1228,84 @@ class DoubanRankMod(_PluginBase):
                                             'clearable': True,
                                             'model': 'blacklist',
                                             'label': '类型黑名单',
-                                            'items': ["真人秀", "脱口秀", "纪录片", "歌舞", "同性"]
+                                            'items': self._blacklist_options
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'douban_api',
+                                            'label': '豆瓣接口地址',
+                                            'placeholder': '留空使用 https://m.douban.com，可指向本地替身服务'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'mapping_file',
+                                            'label': '豆瓣ID映射文件',
+                                            'placeholder': 'CSV/JSONL文件路径，包含 doubanid,tmdbid,type'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'poster_count',
+                                            'label': '海报缓存数量',
+                                            'placeholder': '默认 500'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'workers',
+                                            'label': '解析/识别/检查并发',
+                                            'placeholder': '默认 2,4,2'
                                         }
                                     }
                                 ]
@@ -622,6 +1330,38 @@ class DoubanRankMod(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'rebuild_mapping',
+                                            'label': '重建映射索引',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'dry_run',
+                                            'label': '模拟运行',
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     }
@@ -642,18 +1382,36 @@ class DoubanRankMod(_PluginBase):
             "year_top250": "",
             "cache_duration": "",
             "cache_duration_top250": "",
+            "cache_size": "",
+            "poster_count": "",
+            "workers": "",
             "douban_ranks": [],
             "count": "",
             "genre_rate": "",
-            "clear": False
+            "rank_schedule": "",
+            "clear": False,
+            "mapping_file": "",
+            "dry_run": False,
+            "douban_api": "",
+            "rebuild_mapping": False
         }
 
     def get_page(self) -> List[dict]:
         """
         拼装插件详情页面，需要返回页面配置，同时附带数据
         """
+        page_key = (self._history_version, settings.API_TOKEN)
+        if not self._page_cache or self._page_cache[0] != page_key:
+            self._page_cache = (page_key, self.__build_page())
+        return self._page_cache[1]
+
+    def __build_page(self) -> List[dict]:
+        """
+        拼装历史记录页面
+        """
         # 查询历史记录
-        historys = self.get_data('history_mod')
+        with self._history_lock:
+            historys = list(self.__load_history().values())
         if not historys:
             return [
                 {
@@ -674,7 +1432,6 @@ class DoubanRankMod(_PluginBase):
             count = history.get("count")
             genres = history.get("genres")
             year = history.get("year")
-            poster = history.get("poster")
             rtype = history.get("type")
             time_str = history.get("time")
             tip = history.get("tip") if history.get("tip") else ""
@@ -711,7 +1468,8 @@ class DoubanRankMod(_PluginBase):
                                         {
                                             'component': 'VImg',
                                             'props': {
-                                                'src': poster,
+                                                'src': f"{settings.API_V1_STR}/plugin/DoubanRankMod/poster"
+                                                       f"?doubanid={doubanid}&apikey={settings.API_TOKEN}",
                                                 'height': 120,
                                                 'width': 80,
                                                 'aspect-ratio': '2/3',
@@ -792,6 +1550,13 @@ class DoubanRankMod(_PluginBase):
                     self._scheduler.shutdown()
                     self._event.clear()
                 self._scheduler = None
+            if self._mapping:
+                self._mapping.close()
+            if self._cache:
+                self._cache.flush()
+            if self._poster_executor:
+                self._poster_executor.shutdown(wait=False, cancel_futures=True)
+                self._poster_executor = None
         except Exception as e:
             print(str(e))
 
@@ -801,14 +1566,201 @@ class DoubanRankMod(_PluginBase):
         """
         if apikey != settings.API_TOKEN:
             return schemas.Response(success=False, message="API密钥错误")
-        # 历史记录
-        historys = self.get_data('history_mod')
-        if not historys:
-            return schemas.Response(success=False, message="未找到历史记录")
-        # 删除指定记录
-        historys = [h for h in historys if h.get("unique") != key]
-        self.save_data('history_mod', historys)
+        with self._history_lock:
+            history_index = self.__load_history()
+            if not history_index:
+                return schemas.Response(success=False, message="未找到历史记录")
+            # 删除指定记录
+            if history_index.pop(key, None) is not None:
+                self.__save_history()
         return schemas.Response(success=True, message="删除成功")
+
+    def delete_histories(self, apikey: str, payload: dict = None):
+        """
+        批量删除同步历史记录
+        payload: {
+            "keys": ["doubanrank: 标题 (DB:豆瓣ID)"],
+            "tip": "标题不一致",
+            "type": "电影",
+            "days": 30,
+            "doubanids": ["豆瓣ID"]
+        }
+        按 keys 删除，或删除同时满足 tip/type/days/doubanids 全部条件的记录
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        payload = payload or {}
+        keys = set(payload.get("keys") or [])
+        filters = []
+        if payload.get("tip") is not None:
+            filters.append(lambda h: (h.get("tip") or "") == payload.get("tip"))
+        if payload.get("type"):
+            filters.append(lambda h: h.get("type") == payload.get("type"))
+        if payload.get("days") is not None:
+            try:
+                days = float(payload.get("days"))
+            except (TypeError, ValueError):
+                return schemas.Response(success=False, message="days 必须是数字")
+            filters.append(lambda h: self.__history_age(h) >= days)
+        if payload.get("doubanids"):
+            doubanids = {str(doubanid) for doubanid in payload.get("doubanids")}
+            filters.append(lambda h: str(h.get("doubanid")) in doubanids)
+        if not keys and not filters:
+            return schemas.Response(success=False, message="未指定删除条件")
+        with self._history_lock:
+            history_index = self.__load_history()
+            removed = [unique for unique in keys if unique in history_index]
+            if filters:
+                removed.extend(unique for unique, history in history_index.items()
+                               if unique not in keys and all(f(history) for f in filters))
+            for unique in removed:
+                history_index.pop(unique, None)
+            if removed:
+                self.__save_history()
+        return schemas.Response(success=True, message=f"删除 {len(removed)} 条记录", data={"count": len(removed)})
+
+    def __load_history(self) -> OrderedDict:
+        """
+        加载历史记录索引
+        """
+        if self._history_index is None:
+            self._history_index = OrderedDict((h.get("unique"), h) for h in self.get_data('history_mod') or [])
+        return self._history_index
+
+    def __save_history(self):
+        """
+        一次写入全部历史记录
+        """
+        self.save_data('history_mod', list(self._history_index.values()))
+        self._history_version += 1
+
+    @staticmethod
+    def __history_age(history: dict) -> float:
+        """
+        历史记录距今天数，记录时间不含年份，取不晚于当前时间的最近一个有效日期
+        """
+        try:
+            now = datetime.datetime.now()
+            # 先按闰年解析，2月29日的记录才能通过
+            record_time = datetime.datetime.strptime(f"2000-{history.get('time')}", "%Y-%m-%d %H:%M")
+        except Exception:
+            return 0
+        for year in range(now.year, now.year - 8, -1):
+            try:
+                candidate = record_time.replace(year=year)
+            except ValueError:
+                # 非闰年没有2月29日
+                continue
+            if candidate <= now:
+                return (now - candidate).total_seconds() / 86400
+        return 0
+
+    def dry_run(self, apikey: str, ranks: str = None, live: bool = False):
+        """
+        模拟运行，返回每个条目的决策及各阶段耗时
+        :param ranks: 榜单ID，多个用逗号分隔，为空时使用已选榜单
+        :param live: 忽略缓存，直接获取榜单数据
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        report = self.__refresh_rss(ranks=[r for r in re.split(r'[,，\s]+', ranks or "") if r],
+                                    dry_run=True, live=live)
+        if not report:
+            return schemas.Response(success=False, message="未设置榜单")
+        return schemas.Response(success=True, data=report)
+
+    def poster(self, doubanid: str, apikey: str):
+        """
+        返回本地海报缩略图，未缓存时跳转原图并后台下载
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        file_path = self.posters.path(doubanid)
+        if file_path:
+            content = file_path.read_bytes()
+            return Response(content=content,
+                            media_type=DoubanPosterCache.media_type(content),
+                            headers={"Cache-Control": "public, max-age=2592000, immutable"})
+        with self._history_lock:
+            poster = next((h.get("poster") for h in self.__load_history().values()
+                           if str(h.get("doubanid")) == str(doubanid)), None)
+        if not poster:
+            return schemas.Response(success=False, message="未找到海报")
+        self.__cache_poster(doubanid, poster)
+        return RedirectResponse(url=poster)
+
+    def __cache_poster(self, doubanid: str, poster: str):
+        """
+        后台下载海报缩略图
+        """
+        if not poster:
+            return
+        try:
+            self.poster_executor.submit(self.posters.fetch, doubanid, poster,
+                                         settings.PROXY if self._proxy else None)
+        except RuntimeError:
+            # 服务已停止
+            pass
+
+    def rebuild_mapping(self, apikey: str):
+        """
+        重建豆瓣ID映射索引
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        stats = self.__rebuild_mapping()
+        if not stats:
+            return schemas.Response(success=False, message="重建映射索引失败，请检查映射文件")
+        return schemas.Response(success=True, message="重建成功", data=stats)
+
+    def mapping_stats(self, apikey: str):
+        """
+        豆瓣ID映射索引统计
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if not self._mapping:
+            return schemas.Response(success=False, message="映射索引未初始化")
+        return schemas.Response(success=True, data=self._mapping.stats())
+
+    def __rebuild_mapping(self) -> Optional[dict]:
+        """
+        从映射文件重建索引
+        """
+        if not self._mapping_file or not Path(self._mapping_file).exists():
+            logger.warn(f"豆瓣ID映射文件不存在：{self._mapping_file}")
+            return None
+        try:
+            start = time.perf_counter()
+            stats = self._mapping.rebuild(Path(self._mapping_file))
+            logger.info(f"豆瓣ID映射索引重建完成，共 {stats.get('count')} 条，"
+                        f"大小 {round(stats.get('size') / 1024, 1)} KB，"
+                        f"耗时 {round(time.perf_counter() - start, 2)} 秒")
+            return stats
+        except Exception as e:
+            logger.error(f"豆瓣ID映射索引重建失败：{str(e)}")
+            return None
+
+    def __get_tmdbid(self, doubanid: str, mtype: MediaType, dtype: str, write_back: bool = True) -> Optional[int]:
+        """
+        根据豆瓣ID获取TMDBID，优先查询本地映射索引
+        """
+        if self._mapping:
+            try:
+                tmdbid = self._mapping.lookup(doubanid, dtype)
+                if tmdbid:
+                    return tmdbid
+            except Exception as e:
+                logger.error(f"查询豆瓣ID映射索引失败：{str(e)}")
+        tmdbinfo = self.mediachain.get_tmdbinfo_by_doubanid(doubanid=doubanid, mtype=mtype)
+        if not tmdbinfo or not tmdbinfo.get("id"):
+            return None
+        if self._mapping and write_back:
+            try:
+                self._mapping.put(doubanid, tmdbinfo.get("id"), dtype)
+            except Exception as e:
+                logger.error(f"写入豆瓣ID映射索引失败：{str(e)}")
+        return tmdbinfo.get("id")
     
     def __update_config(self):
         """
@@ -828,147 +1780,307 @@ class DoubanRankMod(_PluginBase):
             "year_top250": self._year_top250,
             "cache_duration": self._cache_duration,
             "cache_duration_top250": self._cache_duration_top250,
+            "cache_size": self._cache_size,
+            "poster_count": self._poster_count,
+            "workers": f"{self._parse_workers},{self._recognize_workers},{self._check_workers}",
             "count": self._count,
             "douban_ranks": self._douban_ranks,
             "blacklist": self._blacklist,
             "genre_rate": '\n'.join(map(str, self._genre_rate)),
-            "clear": self._clear
+            "rank_schedule": '\n'.join(f"{rank}|{schedule.get('cron') or ''}|"
+                                        f"{'' if schedule.get('ttl') is None else schedule.get('ttl')}"
+                                        for rank, schedule in self._rank_schedules.items()),
+            "clear": self._clear,
+            "mapping_file": self._mapping_file,
+            "douban_api": self._douban_api,
+            "rebuild_mapping": self._rebuild_mapping,
+            "dry_run": self._dry_run
         })
 
-    def __refresh_rss(self):
+    def __refresh_rss(self, ranks: List[str] = None, dry_run: bool = None, live: bool = False) -> Optional[dict]:
         """
         刷新RSS
+        :param ranks: 需要刷新的榜单，为空时刷新全部已选榜单
+        :param dry_run: 模拟运行，不添加订阅、不写入历史记录及缓存，为空时使用插件配置
+        :param live: 忽略缓存，直接获取榜单数据
+        :return: 运行报告
         """
-        logger.info(f"开始刷新豆瓣榜单 ...")
+        if dry_run is None:
+            dry_run = self._dry_run
+        logger.info(f"开始{'模拟' if dry_run else ''}刷新豆瓣榜单 ...")
         addr_list = []
         for douban_item in self._douban_list:
             for rank in self._douban_ranks:
-                if rank == douban_item.get("value"):
+                if rank == douban_item.get("value") and (not ranks or rank in ranks):
                     addr_list.append(douban_item)
         if not addr_list:
             logger.info(f"未设置榜单RSS地址")
-            return
+            return None
         else:
             logger.info(f"共 {len(addr_list)} 个榜单RSS地址需要刷新")
 
         # 读取历史记录
         if self._clearflag:
-            history = []
+            unique_flags = set()
         else:
-            history: List[dict] = self.get_data('history_mod') or []
+            with self._history_lock:
+                unique_flags = set(self.__load_history().keys())
+        # 本次新增的历史记录
+        history: List[dict] = []
+        unique_lock = Lock()
+        # 模拟运行的决策记录
+        decisions: List[dict] = []
+        fetch_stats = {}
 
-        for addr in addr_list:
-            if not addr:
-                continue
-            try:
-                logger.info(f"获取RSS：{addr.get('title')} ...")
-                rss_infos = self.__get_rss_info(addr)
-                if not rss_infos:
-                    logger.error(f"RSS地址：{addr.get('title')} ，无符合条件的数据")
-                    continue
+        def __decide(rss_info: dict, decision: str, reason: str = ""):
+            if not dry_run:
+                return
+            with unique_lock:
+                decisions.append({
+                    "rank": rss_info.get("rank"),
+                    "title": rss_info.get("title"),
+                    "doubanid": rss_info.get("doubanid"),
+                    "decision": decision,
+                    "reason": reason
+                })
+
+        def __produce(put: Callable[[Any], None]):
+            expired = []
+            for addr in addr_list:
+                douban_items = None if live else self.__cached_items(addr)
+                if douban_items is None:
+                    expired.append(addr)
                 else:
-                    logger.info(f"RSS地址：{addr.get('title')} ，共 {len(rss_infos)} 条数据")
-                for rss_info in rss_infos:
-                    if self._event.is_set():
-                        logger.info(f"订阅服务停止")
-                        return
-                    title = rss_info.get('title')
-                    type = rss_info.get('type')
-                    doubanid = rss_info.get('doubanid')
-                    year = rss_info.get('year')
-                    rate = rss_info.get('rate')
-                    count = rss_info.get('count')
-                    genres = rss_info.get('genres')
-
-                    tip = ""
-
-                    rtype = '电影' if type == 'movie' else '电视剧'
-
-                    mtype = MediaType.TV if type == 'tv' else MediaType.MOVIE
-
-                    logger.info(f"片名：{title}，类型：{genres}，评分：{rate}，链接：https://movie.douban.com/subject/{doubanid}")
-  
-                    unique_flag = f"doubanrank: {title} (DB:{doubanid})"
-                    # 检查是否已处理过
-                    if unique_flag in [h.get("unique") for h in history]:
-                        continue
-                    # 元数据
-                    meta = MetaInfo(title)
-                    meta.year = year
-                    if mtype:
-                        meta.type = mtype
-                    # 识别媒体信息
-                    if doubanid:
-                        # 识别豆瓣信息
-                        if settings.RECOGNIZE_SOURCE == "themoviedb":
-                            tmdbinfo = self.mediachain.get_tmdbinfo_by_doubanid(doubanid=doubanid, mtype=meta.type)
-                            if not tmdbinfo:
-                                logger.warn(f'未能通过豆瓣ID {doubanid} 获取到TMDB信息，标题：{title}，豆瓣ID：{doubanid}')
-                                continue
-                            mediainfo = self.chain.recognize_media(meta=meta, tmdbid=tmdbinfo.get("id"))
-                            if not mediainfo:
-                                logger.warn(f'TMDBID {tmdbinfo.get("id")} 未识别到媒体信息')
-                                continue
-                        else:
-                            mediainfo = self.chain.recognize_media(meta=meta, doubanid=doubanid)
-                            if not mediainfo:
-                                logger.warn(f'豆瓣ID {doubanid} 未识别到媒体信息')
-                                continue
-                    else:
-                        # 匹配媒体信息
-                        mediainfo: MediaInfo = self.chain.recognize_media(meta=meta)
-                        if not mediainfo:
-                            logger.warn(f'未识别到媒体信息，标题：{title}，豆瓣ID：{doubanid}')
-                            continue
-                    
-                    if mediainfo.title not in title:
-                        logger.warn(f'识别到的标题与豆瓣标题不一致，豆瓣标题：{title}，识别到的标题：{mediainfo.title}')
-                        tip = "标题不一致"
-
-                    # 查询缺失的媒体信息
-                    exist_flag, _ = self.downloadchain.get_no_exists_info(meta=meta, mediainfo=mediainfo)
-                    if exist_flag:
-                        logger.info(f'{mediainfo.title_year} 媒体库中已存在')
-                        continue
-                    # 判断用户是否已经添加订阅
-                    if self.subscribechain.exists(mediainfo=mediainfo, meta=meta):
-                        logger.info(f'{mediainfo.title_year} 订阅已存在')
-                        continue
+                    put((addr, douban_items, False))
+            if not expired:
+                return
 
-                    if not tip:
-                        # 添加订阅
-                        self.subscribechain.add(title=mediainfo.title,
-                                                year=mediainfo.year,
-                                                mtype=mediainfo.type,
-                                                tmdbid=mediainfo.tmdb_id,
-                                                season=meta.begin_season,
-                                                exist_ok=True,
-                                                username="豆瓣榜单")
-                    # 存储历史记录
-                    history.append({
-                        "title": title,
-                        "rate": rate,
-                        "count": count,
-                        "type": rtype,
-                        "genres": genres,
-                        "year": mediainfo.year,
-                        "poster": mediainfo.get_poster_image(),
-                        "overview": mediainfo.overview,
-                        "tmdbid": mediainfo.tmdb_id,
-                        "doubanid": doubanid,
-                        "time": datetime.datetime.now().strftime("%m-%d %H:%M"),
-                        "tip": tip,
-                        "unique": unique_flag
-                    })
-            except Exception as e:
-                logger.error(str(e))
+            def __on_result(addr: dict, douban_items: list, error: Optional[str]):
+                if error:
+                    logger.error(f"获取RSS失败：{addr.get('title')} {error}")
+                elif not self._event.is_set():
+                    put((addr, douban_items, True))
+
+            logger.info(f"获取RSS：{'、'.join(addr.get('title') for addr in expired)} ...")
+            fetch_stats.update(self.__new_fetcher().run(expired, __on_result))
+            logger.info(f"豆瓣榜单获取完成，请求 {fetch_stats.get('requests')} 次，失败 {fetch_stats.get('errors')} 次，"
+                        f"共 {round(fetch_stats.get('bytes') / 1024, 1)} KB，耗时 {fetch_stats.get('elapsed')} 秒")
+
+        def __parse(task: tuple) -> List[dict]:
+            addr, douban_items, fresh = task
+            if fresh and not dry_run:
+                self.cache.put(addr.get("value"), douban_items)
+            rss_infos = self.__get_rss_info(addr, douban_items,
+                                            on_filtered=lambda info, reason: __decide(info, "filtered", reason))
+            if not rss_infos:
+                logger.error(f"RSS地址：{addr.get('title')} ，无符合条件的数据")
+                return []
+            logger.info(f"RSS地址：{addr.get('title')} ，共 {len(rss_infos)} 条数据")
+            return rss_infos
+
+        def __recognize(rss_info: dict) -> list:
+            unique_flag = f"doubanrank: {rss_info.get('title')} (DB:{rss_info.get('doubanid')})"
+            # 检查是否已处理过
+            with unique_lock:
+                if unique_flag in unique_flags:
+                    processed = True
+                else:
+                    processed = False
+                    unique_flags.add(unique_flag)
+            if processed:
+                __decide(rss_info, "history", "已处理过")
+                return []
+            result = self.__recognize_item(rss_info, dry_run=dry_run)
+            if not result:
+                __decide(rss_info, "unrecognized", "未识别到媒体信息")
+                return []
+            return [result]
+
+        def __check(item: tuple) -> list:
+            reason = self.__check_item(*item)
+            if reason:
+                __decide(item[0], "exists", reason)
+                return []
+            return [item]
+
+        def __subscribe(item: tuple) -> list:
+            rss_info, _, mediainfo, tip = item
+            history.append(self.__subscribe_item(*item, dry_run=dry_run))
+            if tip:
+                __decide(rss_info, "mismatch", f"{tip}，识别到的标题：{mediainfo.title_year}")
+            else:
+                __decide(rss_info, "subscribe", f"将订阅：{mediainfo.title_year}")
+            return []
 
-        # 保存历史记录
-        self.save_data('history_mod', history)
+        stages = [
+            DoubanPipelineStage("解析", __parse, self._parse_workers, self._event),
+            DoubanPipelineStage("识别", __recognize, self._recognize_workers, self._event),
+            DoubanPipelineStage("检查", __check, self._check_workers, self._event),
+            # 订阅及写历史记录保持单线程
+            DoubanPipelineStage("订阅", __subscribe, 1, self._event)
+        ]
+        start = time.perf_counter()
+        DoubanPipelineStage.run(stages, [], self._queue_size, producer=__produce)
+        elapsed = time.perf_counter() - start
+        if self._event.is_set():
+            logger.info(f"订阅服务停止")
+        for stage in stages:
+            logger.info(stage.report(elapsed))
+
+        summary = {}
+        for decision in decisions:
+            summary[decision.get("decision")] = summary.get(decision.get("decision"), 0) + 1
+        report = {
+            "dry_run": dry_run,
+            "elapsed": round(elapsed, 3),
+            "fetch": fetch_stats,
+            "stages": [stage.summary(elapsed) for stage in stages],
+            "summary": summary,
+            "items": decisions
+        }
+        if dry_run:
+            logger.info(f"豆瓣榜单模拟运行完成，耗时 {round(elapsed, 2)} 秒，结果：{summary}")
+            return report
+
+        # 保存历史记录，合并刷新期间的删除操作
+        with self._history_lock:
+            if self._clearflag:
+                self._history_index = OrderedDict()
+            history_index = self.__load_history()
+            for h in history:
+                history_index[h.get("unique")] = h
+            self.__save_history()
         # 缓存只清理一次
         self._clearflag = False
-        logger.info(f"所有榜单RSS刷新完成")
-    
+        logger.info(f"所有榜单RSS刷新完成，耗时 {round(elapsed, 2)} 秒")
+        return report
+
+    def __recognize_item(self, rss_info: dict, dry_run: bool = False) -> Optional[tuple]:
+        """
+        识别媒体信息，返回 (rss_info, meta, mediainfo, tip)
+        """
+        title = rss_info.get('title')
+        type = rss_info.get('type')
+        doubanid = rss_info.get('doubanid')
+        year = rss_info.get('year')
+        genres = rss_info.get('genres')
+        rate = rss_info.get('rate')
+
+        tip = ""
+
+        mtype = MediaType.TV if type == 'tv' else MediaType.MOVIE
+
+        logger.info(f"片名：{title}，类型：{genres}，评分：{rate}，链接：https://movie.douban.com/subject/{doubanid}")
+
+        # 元数据
+        meta = MetaInfo(title)
+        meta.year = year
+        if mtype:
+            meta.type = mtype
+        # 识别媒体信息
+        if doubanid:
+            # 识别豆瓣信息
+            if settings.RECOGNIZE_SOURCE == "themoviedb":
+                tmdbid = self.__get_tmdbid(doubanid=doubanid, mtype=meta.type, dtype=type, write_back=not dry_run)
+                if not tmdbid:
+                    logger.warn(f'未能通过豆瓣ID {doubanid} 获取到TMDB信息，标题：{title}，豆瓣ID：{doubanid}')
+                    return None
+                mediainfo = self.chain.recognize_media(meta=meta, tmdbid=tmdbid)
+                if not mediainfo:
+                    logger.warn(f'TMDBID {tmdbid} 未识别到媒体信息')
+                    return None
+            else:
+                mediainfo = self.chain.recognize_media(meta=meta, doubanid=doubanid)
+                if not mediainfo:
+                    logger.warn(f'豆瓣ID {doubanid} 未识别到媒体信息')
+                    return None
+        else:
+            # 匹配媒体信息
+            mediainfo: MediaInfo = self.chain.recognize_media(meta=meta)
+            if not mediainfo:
+                logger.warn(f'未识别到媒体信息，标题：{title}，豆瓣ID：{doubanid}')
+                return None
+
+        if mediainfo.title not in title:
+            logger.warn(f'识别到的标题与豆瓣标题不一致，豆瓣标题：{title}，识别到的标题：{mediainfo.title}')
+            tip = "标题不一致"
+
+        return rss_info, meta, mediainfo, tip
+
+    def __check_item(self, rss_info: dict, meta: MetaInfo, mediainfo: MediaInfo, tip: str) -> Optional[str]:
+        """
+        检查媒体库及订阅是否已存在，返回已存在的原因，为空时继续订阅
+        """
+        # 查询缺失的媒体信息
+        exist_flag, _ = self.downloadchain.get_no_exists_info(meta=meta, mediainfo=mediainfo)
+        if exist_flag:
+            logger.info(f'{mediainfo.title_year} 媒体库中已存在')
+            return "媒体库中已存在"
+        # 判断用户是否已经添加订阅
+        if self.subscribechain.exists(mediainfo=mediainfo, meta=meta):
+            logger.info(f'{mediainfo.title_year} 订阅已存在')
+            return "订阅已存在"
+        return None
+
+    def __subscribe_item(self, rss_info: dict, meta: MetaInfo, mediainfo: MediaInfo, tip: str,
+                         dry_run: bool = False) -> dict:
+        """
+        添加订阅，返回历史记录，模拟运行时不添加订阅
+        """
+        title = rss_info.get('title')
+        doubanid = rss_info.get('doubanid')
+        if not tip and not dry_run:
+            # 添加订阅
+            self.subscribechain.add(title=mediainfo.title,
+                                    year=mediainfo.year,
+                                    mtype=mediainfo.type,
+                                    tmdbid=mediainfo.tmdb_id,
+                                    season=meta.begin_season,
+                                    exist_ok=True,
+                                    username="豆瓣榜单")
+        # 缓存海报
+        if not dry_run:
+            self.__cache_poster(doubanid, mediainfo.get_poster_image())
+        # 历史记录
+        return {
+            "title": title,
+            "rate": rss_info.get('rate'),
+            "count": rss_info.get('count'),
+            "type": '电影' if rss_info.get('type') == 'movie' else '电视剧',
+            "genres": rss_info.get('genres'),
+            "year": mediainfo.year,
+            "poster": mediainfo.get_poster_image(),
+            "overview": mediainfo.overview,
+            "tmdbid": mediainfo.tmdb_id,
+            "doubanid": doubanid,
+            "time": datetime.datetime.now().strftime("%m-%d %H:%M"),
+            "tip": tip,
+            "unique": f"doubanrank: {title} (DB:{doubanid})"
+        }
+
+    def __parse_rank_schedules(self, rank_schedule: Any) -> Dict[str, dict]:
+        """
+        解析榜单独立调度，每行格式：榜单ID|cron表达式|缓存分钟，cron或缓存可留空
+        """
+        if isinstance(rank_schedule, list):
+            rank_schedule = '\n'.join(rank_schedule)
+        values = {item.get("value") for item in self._douban_list}
+        schedules = {}
+        for line in str(rank_schedule or "").splitlines():
+            parts = [part.strip() for part in line.split("|")]
+            if not parts[0]:
+                continue
+            if parts[0] not in values:
+                logger.warn(f"未知的豆瓣榜单：{parts[0]}")
+                continue
+            cron = parts[1] if len(parts) > 1 else ""
+            ttl = parts[2] if len(parts) > 2 else ""
+            schedules[parts[0]] = {
+                "cron": cron,
+                "ttl": int(ttl) if ttl.isdigit() else None
+            }
+        return schedules
+
     def check_genre_rate(self, all_genres, rate, _genre_rate):
         for genre_rate in _genre_rate:
             # 分割genre和rate
@@ -1016,36 +2128,56 @@ class DoubanRankMod(_PluginBase):
         # 只要地区评分或分类评分有一个通过即可
         return country_rate_pass or genre_rate_pass
 
-    def __get_rss_info(self, addr) -> List[dict]:
+    def __cached_items(self, addr: dict) -> Optional[list]:
         """
-        获取RSS
+        读取未过期的榜单缓存
         """
-        try:
-            key = addr.get("value")
-            cached_data = self.get_data(key)
+        key = addr.get("value")
+        cached_data = self.cache.get(key)
 
-            douban_items = []
-            douban_array = []
+        if self._rank_schedules.get(key, {}).get("ttl") is not None:
+            cache_duration = int(self._rank_schedules[key]["ttl"]) * 60
+        elif key == "movie_top250":
+            cache_duration = int(self._cache_duration_top250) * 60
+        else:
+            cache_duration = int(self._cache_duration) * 60
 
-            if key == "movie_top250":
-                cache_duration = int(self._cache_duration_top250) * 60
-            else:
-                cache_duration = int(self._cache_duration) * 60
+        if not cached_data or time.time() - cached_data.get("timestamp", 0) > cache_duration:
+            logger.info(f"缓存数据过期，重新获取: {key}")
+            return None
+        logger.info(f"使用缓存数据: {key}")
+        return cached_data["data"]
 
-            if not cached_data or time.time() - cached_data.get("timestamp", 0) > cache_duration:
-                logger.info(f"缓存数据过期，重新获取: {key}")
-                if self._proxy:
-                    ret = RequestUtils(proxies=settings.PROXY, referer=addr.get("referer")).get_res(addr.get("address"))
-                else:
-                    ret = RequestUtils(referer=addr.get("referer")).get_res(addr.get("address"))
-                if not ret:
-                    return []
-                douban_items = json.loads(ret.text).get('subject_collection_items')
-                self.save_data(key, {"data": douban_items, "timestamp": time.time()}) # 保存数据，包含时间戳
-            else:
-                logger.info(f"使用缓存数据: {key}")
-                douban_items = cached_data["data"]
-                    
+    def __new_fetcher(self) -> "DoubanAsyncFetcher":
+        """
+        创建榜单异步获取引擎
+        """
+        from .fetcher import DoubanAsyncFetcher
+        return DoubanAsyncFetcher(proxy=settings.PROXY_HOST if self._proxy else None,
+                                  base_url=self._douban_api or None,
+                                  user_agent=settings.USER_AGENT,
+                                  blocking_get=self.__blocking_get)
+
+    def __blocking_get(self, url: str, referer: str) -> Optional[bytes]:
+        """
+        同步请求，未安装httpx时由异步引擎在线程池中调用，非2xx响应视为失败
+        """
+        if self._proxy:
+            ret = RequestUtils(proxies=settings.PROXY, referer=referer).get_res(url)
+        else:
+            ret = RequestUtils(referer=referer).get_res(url)
+        if ret is None or not 200 <= ret.status_code < 300:
+            return None
+        return ret.content
+
+    def __get_rss_info(self, addr: dict, douban_items: list,
+                       on_filtered: Callable[[dict, str], None] = None) -> List[dict]:
+        """
+        解析RSS
+        :param on_filtered: 条目被筛除时回调 (rss_info, 原因)
+        """
+        try:
+            douban_array = []
             for item in douban_items:
                 try:
                     rss_info = {}
@@ -1083,8 +2215,12 @@ class DoubanRankMod(_PluginBase):
                     else:
                         isTop250 = False
                     if not self.filter_item(year, count, all_genres, card_subtitle, rate, type, isTop250):
+                        if on_filtered:
+                            on_filtered({"rank": addr.get("title"), "title": title, "doubanid": doubanid},
+                                        f"年份：{year}，评分：{rate}，人数：{count}，类型：{genres_text}，{card_subtitle}")
                         continue
 
+                    rss_info['rank'] = addr.get("title")
                     rss_info['title'] = title
                     rss_info['doubanid'] = doubanid
                     rss_info['type'] = type
@@ -1098,5 +2234,5 @@ class DoubanRankMod(_PluginBase):
                     continue
             return douban_array
         except Exception as e:
-            logger.error("获取RSS失败：" + str(e))
+            logger.error("解析RSS失败：" + str(e))
             return []
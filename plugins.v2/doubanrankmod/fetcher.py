@@ -0,0 +1,234 @@
+"""
+豆瓣榜单异步获取引擎，不依赖MoviePilot，可配合 tools/doubanstub.py 离线测试
+"""
+import asyncio
+import codecs
+import json
+import re
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class DoubanItemParser:
+    """
+    增量解析榜单响应，逐条取出 subject_collection_items 中的条目，只保留筛选需要的字段
+    """
+
+    _array_start = re.compile(r'"subject_collection_items"\s*:\s*\[')
+    _separator = re.compile(r'[\s,]*')
+    # 键名可能被截断时保留的末尾长度
+    _keep = len('"subject_collection_items"') + 32
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._in_array = False
+        self._done = False
+
+    @staticmethod
+    def trim(item: dict) -> dict:
+        rating = item.get("rating")
+        trimmed = {
+            "id": item.get("id"),
+            "title": item.get("title"),
+            "type": item.get("type"),
+            "card_subtitle": item.get("card_subtitle")
+        }
+        if rating:
+            trimmed["rating"] = {"value": rating.get("value"), "count": rating.get("count")}
+        return trimmed
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[dict]:
+        """
+        输入一段响应数据，返回其中已完整的条目
+        final 时仍未找到完整的条目数组视为无效响应，抛出 ValueError
+        """
+        if self._done:
+            return []
+        self._buffer += self._decoder.decode(chunk, final)
+        if not self._in_array:
+            match = self._array_start.search(self._buffer)
+            if not match:
+                if final:
+                    raise ValueError(f"响应中没有榜单条目：{self._buffer[:100]}")
+                self._buffer = self._buffer[-self._keep:]
+                return []
+            self._in_array = True
+            self._buffer = self._buffer[match.end():]
+        items = []
+        pos = 0
+        while True:
+            pos = self._separator.match(self._buffer, pos).end()
+            if pos >= len(self._buffer):
+                break
+            if self._buffer[pos] == "]":
+                self._done = True
+                break
+            try:
+                item, pos = self._json.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                # 条目不完整，等待后续数据
+                if final:
+                    raise
+                break
+            items.append(self.trim(item))
+        if final and not self._done:
+            raise ValueError("榜单条目不完整")
+        # 丢弃已解析部分
+        self._buffer = "" if self._done else self._buffer[pos:]
+        return items
+
+    @classmethod
+    def parse(cls, chunks: Iterable[bytes]) -> List[dict]:
+        parser = cls()
+        items = []
+        for chunk in chunks:
+            items.extend(parser.feed(chunk))
+        items.extend(parser.feed(b"", final=True))
+        return items
+
+    @staticmethod
+    def chunks(content: bytes, size: int = 65536) -> Iterable[memoryview]:
+        view = memoryview(content)
+        for offset in range(0, len(view), size):
+            yield view[offset:offset + size]
+
+
+class DoubanAsyncFetcher:
+    """
+    在单个线程的事件循环中并发获取多个榜单及其分页
+    未安装httpx时，通过 blocking_get 在线程池中执行同步请求
+    """
+
+    def __init__(self,
+                 page_size: int = 50,
+                 concurrency: int = 6,
+                 timeout: float = 20,
+                 retries: int = 1,
+                 proxy: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 user_agent: Optional[str] = None,
+                 blocking_get: Optional[Callable[[str, str], Optional[bytes]]] = None):
+        self._page_size = page_size
+        self._concurrency = concurrency
+        self._timeout = timeout
+        self._retries = retries
+        self._proxy = proxy
+        self._base_url = base_url.rstrip("/") if base_url else None
+        self._user_agent = user_agent
+        self._blocking_get = blocking_get
+        # 统计
+        self.stats = {}
+
+    def rewrite(self, url: str) -> str:
+        """
+        替换接口地址，用于指向本地替身服务
+        """
+        if not self._base_url:
+            return url
+        base = urlsplit(self._base_url)
+        parts = urlsplit(url)
+        return urlunsplit((base.scheme, base.netloc, base.path + parts.path, parts.query, parts.fragment))
+
+    def pages(self, url: str) -> List[str]:
+        """
+        按分页大小拆分请求地址
+        """
+        parts = urlsplit(self.rewrite(url))
+        query = dict(parse_qsl(parts.query))
+        start = int(query.get("start") or 0)
+        count = int(query.get("count") or 0)
+        if count <= self._page_size:
+            return [urlunsplit(parts)]
+        urls = []
+        for offset in range(start, start + count, self._page_size):
+            query["start"] = offset
+            query["count"] = min(self._page_size, start + count - offset)
+            urls.append(urlunsplit(parts._replace(query=urlencode(query))))
+        return urls
+
+    async def __get(self, client, semaphore: asyncio.Semaphore, url: str, referer: str) -> List[dict]:
+        """
+        请求一页数据，边下载边解析
+        """
+        last_error = None
+        for _ in range(self._retries + 1):
+            async with semaphore:
+                self.stats["requests"] += 1
+                try:
+                    parser = DoubanItemParser()
+                    items = []
+                    if client:
+                        async with client.stream("GET", url, headers={"Referer": referer}) as res:
+                            res.raise_for_status()
+                            async for chunk in res.aiter_bytes():
+                                self.stats["bytes"] += len(chunk)
+                                items.extend(parser.feed(chunk))
+                    else:
+                        content = await asyncio.get_running_loop().run_in_executor(
+                            None, self._blocking_get, url, referer)
+                        if content is None:
+                            raise IOError(f"请求失败：{url}")
+                        self.stats["bytes"] += len(content)
+                        for chunk in DoubanItemParser.chunks(content):
+                            items.extend(parser.feed(chunk))
+                    items.extend(parser.feed(b"", final=True))
+                    return items
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    last_error = e
+        raise last_error
+
+    async def __fetch_list(self, client, semaphore: asyncio.Semaphore, addr: dict) -> Tuple[dict, list, Optional[str]]:
+        start = time.perf_counter()
+        try:
+            pages = await asyncio.gather(*[self.__get(client, semaphore, url, addr.get("referer"))
+                                           for url in self.pages(addr.get("address"))])
+            items = []
+            for page in pages:
+                items.extend(page)
+            return addr, items, None
+        except Exception as e:
+            return addr, [], str(e) or e.__class__.__name__
+        finally:
+            self.stats["lists"][addr.get("value")] = round(time.perf_counter() - start, 3)
+
+    async def fetch_all(self, addrs: List[dict], on_result: Callable[[dict, list, Optional[str]], None]):
+        """
+        并发获取全部榜单，每个榜单完成后立即回调 on_result(addr, items, error)
+        """
+        semaphore = asyncio.Semaphore(self._concurrency)
+        client = None
+        if httpx:
+            headers = {"User-Agent": self._user_agent} if self._user_agent else {}
+            try:
+                client = httpx.AsyncClient(timeout=self._timeout, headers=headers, proxy=self._proxy)
+            except TypeError:
+                # 旧版本httpx
+                client = httpx.AsyncClient(timeout=self._timeout, headers=headers, proxies=self._proxy)
+        elif not self._blocking_get:
+            raise RuntimeError("未安装httpx且未提供同步请求方法")
+        try:
+            for task in asyncio.as_completed([self.__fetch_list(client, semaphore, addr) for addr in addrs]):
+                on_result(*(await task))
+        finally:
+            if client:
+                await client.aclose()
+
+    def run(self, addrs: List[dict], on_result: Callable[[dict, list, Optional[str]], None]) -> dict:
+        """
+        在当前线程中运行事件循环，供定时任务同步调用
+        """
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0, "lists": {}}
+        start = time.perf_counter()
+        if addrs:
+            asyncio.run(self.fetch_all(addrs, on_result))
+        self.stats["elapsed"] = round(time.perf_counter() - start, 3)
+        return self.stats
@@ -1,9 +1,19 @@
+import base64
 import ipaddress
 import threading
 import re
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from functools import lru_cache
 from threading import Lock
 from typing import List, Tuple, Dict, Any, Optional
 
+from app import schemas
+from app.core.config import settings
 from app.core.event import eventmanager, Event
 from app.helper.downloader import DownloaderHelper
 from app.helper.mediaserver import MediaServerHelper
@@ -14,6 +24,571 @@ from app.schemas.types import EventType
 from app.utils.ip import IpUtils
 
 
+class PlayingSession:
+    """
+    统一的播放会话记录，由各媒体服务器的原始会话转换而来
+    """
+    __slots__ = ("key", "user", "title", "bitrate", "bitrate_source", "path", "address", "media_type", "paused")
+
+    # 码率来源：转码输出、服务器实测传输、源文件
+    TRANSCODE = "transcode"
+    BANDWIDTH = "bandwidth"
+    SOURCE = "source"
+
+    def __init__(self, key: str, user: str, title: str, bitrate: int, path: Optional[str], address: str,
+                 media_type: str, paused: bool, bitrate_source: str = SOURCE):
+        # 会话标识，用于匹配Webhook事件
+        self.key = key
+        self.user = user
+        self.title = title
+        self.bitrate = bitrate
+        self.bitrate_source = bitrate_source
+        # Plex 会话无路径，全部按上行计算
+        self.path = path
+        self.address = address
+        self.media_type = media_type
+        self.paused = paused
+
+    @staticmethod
+    def __item_title(item: dict) -> str:
+        if item.get("SeriesName"):
+            return f"{item.get('SeriesName')} S{item.get('ParentIndexNumber', 0)}E{item.get('IndexNumber', 0)} " \
+                   f"{item.get('Name', '')}"
+        return f"{item.get('Name', '')} ({item.get('ProductionYear', 0)})"
+
+    @classmethod
+    def __from_item(cls, session: dict, item: dict, bitrate: int) -> "PlayingSession":
+        # 转码时按转码输出码率计算，否则按源文件码率
+        transcode_bitrate = int((session.get("TranscodingInfo") or {}).get("Bitrate") or 0)
+        return cls(key=session.get("Id") or f"{session.get('UserName')}|{session.get('DeviceName')}|{item.get('Id')}|"
+                                            f"{session.get('RemoteEndPoint')}",
+                   user=session.get("UserName", ""),
+                   title=cls.__item_title(item),
+                   bitrate=transcode_bitrate or bitrate,
+                   bitrate_source=cls.TRANSCODE if transcode_bitrate else cls.SOURCE,
+                   path=item.get("Path") or "",
+                   address=session.get("RemoteEndPoint"),
+                   media_type=item.get("MediaType", ""),
+                   paused=bool((session.get("PlayState") or {}).get("IsPaused")))
+
+    @classmethod
+    def from_emby(cls, sessions: list) -> List["PlayingSession"]:
+        records = []
+        for session in sessions:
+            item = session.get("NowPlayingItem")
+            if item:
+                records.append(cls.__from_item(session, item, int(item.get("Bitrate") or 0)))
+        return records
+
+    @classmethod
+    def from_jellyfin(cls, sessions: list) -> List["PlayingSession"]:
+        records = []
+        for session in sessions:
+            item = session.get("NowPlayingItem")
+            if item:
+                bitrate = sum(int(stream.get("BitRate") or 0) for stream in item.get("MediaStreams") or [])
+                records.append(cls.__from_item(session, item, bitrate))
+        return records
+
+    @classmethod
+    def from_plex(cls, sessions: list) -> List["PlayingSession"]:
+        records = []
+        for session in sessions:
+            if getattr(session, "grandparentTitle", None):
+                title = f"{session.grandparentTitle} S{session.parentIndex or 0}E{session.index or 0} {session.title}"
+            else:
+                title = f"{session.title} ({getattr(session, 'year', 0) or 0})"
+            usernames = getattr(session, "usernames", None) or [""]
+            # Plex 码率单位为 kbps，优先使用服务器统计的会话带宽
+            play_session = getattr(session, "session", None)
+            if isinstance(play_session, list):
+                play_session = play_session[0] if play_session else None
+            bandwidth = int(getattr(play_session, "bandwidth", None) or 0) * 1000
+            records.append(cls(key=getattr(session.player, "machineIdentifier", None) or str(session.sessionKey),
+                               user=usernames[0],
+                               title=title,
+                               bitrate=bandwidth or int(sum(m.bitrate or 0 for m in session.media)) * 1000,
+                               bitrate_source=cls.BANDWIDTH if bandwidth else cls.SOURCE,
+                               path=None,
+                               address=session.player.address,
+                               media_type=session.TAG,
+                               paused=getattr(session.player, "state", None) == "paused"))
+        return records
+
+    @classmethod
+    def from_event(cls, event: WebhookEventInfo) -> "PlayingSession":
+        """
+        由Webhook事件生成会话，json_object中没有码率时为0，事件中没有路径时为None，由查询结果补全
+        """
+        json_object = event.json_object if isinstance(event.json_object, dict) else {}
+        item = json_object.get("Item") or {}
+        bitrate = int(item.get("Bitrate") or 0)
+        if not bitrate:
+            for source in item.get("MediaSources") or []:
+                bitrate = int(source.get("Bitrate") or 0) \
+                          or sum(int(stream.get("BitRate") or 0) for stream in source.get("MediaStreams") or [])
+                if bitrate:
+                    break
+        if not bitrate:
+            bitrate = sum(int(stream.get("BitRate") or 0) for stream in item.get("MediaStreams") or [])
+        transcode_bitrate = int(((json_object.get("Session") or {}).get("TranscodingInfo")
+                                 or json_object.get("TranscodingInfo") or {}).get("Bitrate") or 0)
+        session_id = (json_object.get("Session") or {}).get("Id") \
+            or json_object.get("SessionId") \
+            or (json_object.get("Player") or {}).get("uuid")
+        media_type = item.get("MediaType") or ("Video" if event.item_type in ["MOV", "TV", "SHOW"] else "")
+        return cls(key=session_id or f"{event.user_name}|{event.device_name}|{event.item_id}|{event.ip}",
+                   user=event.user_name or "",
+                   title=event.item_name or "",
+                   bitrate=transcode_bitrate or bitrate,
+                   bitrate_source=cls.TRANSCODE if transcode_bitrate else cls.SOURCE,
+                   path=event.item_path or None,
+                   address=event.ip,
+                   media_type=media_type,
+                   paused=False)
+
+    def same_as(self, other: "PlayingSession") -> bool:
+        """
+        标识相同，或同一地址播放同一文件
+        """
+        return self.key == other.key or bool(self.path and self.path == other.path and self.address == other.address)
+
+    def to_dict(self) -> dict:
+        return {
+            "user": self.user,
+            "title": self.title,
+            "bitrate": f"{round(self.bitrate / 10 ** 6, 1)} Mbps",
+            "bitrate_source": self.bitrate_source
+        }
+
+
+class AddressClassifier:
+    """
+    不限速地址范围，配置时解析并合并为有序整数区间，按地址缓存判断结果
+    """
+    # 在不限速范围内
+    UNLIMITED = "unlimited"
+    # 内网地址
+    PRIVATE = "private"
+    # 需要限速
+    LIMITED = "limited"
+
+    def __init__(self, ipv4: str = "", ipv6: str = "", cache_size: int = 1024):
+        # 是否设置了不限速范围
+        self.configured = bool(ipv4 or ipv6)
+        self._ranges = {
+            4: self.__compile(ipv4, 4),
+            6: self.__compile(ipv6, 6)
+        }
+        self.classify = lru_cache(maxsize=cache_size)(self.__classify)
+
+    @staticmethod
+    def __compile(networks: str, version: int) -> Optional[Tuple[List[int], List[int]]]:
+        """
+        解析逗号分隔的网段，合并重叠区间，返回 (起点列表, 终点列表)；未设置时返回None，表示全部不限速
+        """
+        if not networks:
+            return None
+        ranges = []
+        for network in networks.split(","):
+            if not network.strip():
+                continue
+            try:
+                net = ipaddress.ip_network(network.strip(), strict=False)
+            except ValueError as e:
+                logger.warning(f"不限速地址 {network} 格式错误：{str(e)}")
+                continue
+            if net.version != version:
+                logger.warning(f"不限速地址 {network} 不是IPv{version}地址")
+                continue
+            ranges.append((int(net.network_address), int(net.broadcast_address)))
+        starts, ends = [], []
+        for start, end in sorted(ranges):
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return starts, ends
+
+    def __contains(self, ipaddr) -> bool:
+        ranges = self._ranges[ipaddr.version]
+        if ranges is None:
+            return True
+        starts, ends = ranges
+        value = int(ipaddr)
+        index = bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+    def __classify(self, ip: str) -> str:
+        if self.configured:
+            try:
+                ipaddr = ipaddress.ip_address(ip)
+                if ipaddr.version == 6 and ipaddr.ipv4_mapped:
+                    ipaddr = ipaddr.ipv4_mapped
+                if self.__contains(ipaddr):
+                    return self.UNLIMITED
+            except ValueError:
+                pass
+        return self.PRIVATE if IpUtils.is_private_ip(ip) else self.LIMITED
+
+
+class PathMatcher:
+    """
+    限速路径匹配，配置时将上行、下行路径编译为一个 Aho-Corasick 自动机，一次扫描得出方向，按路径缓存结果
+    """
+    UP = 1
+    DOWN = 2
+
+    def __init__(self, include_path_up: str = "", include_path_down: str = "", cache_size: int = 1024):
+        # 状态转移、失配指针、命中标记
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[int] = [0]
+        for flag, paths in ((self.UP, include_path_up), (self.DOWN, include_path_down)):
+            for pattern in (paths or "").split("\n"):
+                pattern = pattern.strip()
+                if pattern:
+                    self.__add(pattern, flag)
+        self.__build()
+        self.match = lru_cache(maxsize=cache_size)(self.__match)
+
+    def __add(self, pattern: str, flag: int):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(0)
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state] |= flag
+
+    def __build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def __match(self, path: str) -> Optional[int]:
+        """
+        返回 UP/DOWN，上行优先；均未命中返回None
+        """
+        state = 0
+        flags = 0
+        for char in path or "":
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            flags |= self._output[state]
+            if flags & self.UP:
+                return self.UP
+        return self.DOWN if flags & self.DOWN else None
+
+
+class BandwidthController:
+    """
+    闭环限速，按网卡实际流量以PI控制调整下载器总限速，使线路保留目标余量
+    输出 = 开环估算值 + 比例项 + 积分项，积分项单独保存
+    """
+    # 单次积分步长 ki * 间隔 的上限，检查间隔较长时保持稳定
+    MAX_STEP = 0.5
+    # 距上次调整超过最长检查间隔的倍数时视为采样过期
+    STALE = 2
+
+    def __init__(self, interface: str, headroom: float = 15, kp: float = 0.3, ki: float = 0.05,
+                 min_interval: float = 10, max_interval: float = 60):
+        self.interface = interface
+        self.headroom = headroom
+        self.kp = kp
+        self.ki = ki
+        # 积分按不超过最短检查间隔的时间计算（秒）
+        self.min_interval = max(min_interval, 1)
+        self.max_interval = max(max_interval, self.min_interval)
+        # 上次采样 (时间, 接收字节, 发送字节)
+        self._sample: Optional[Tuple[float, int, int]] = None
+        # 实测速率（bps）
+        self.rates = {"up": 0, "down": 0}
+        # 各方向控制状态
+        self.state: Dict[str, dict] = {}
+
+    @staticmethod
+    def read_counters(interface: str) -> Optional[Tuple[int, int]]:
+        """
+        读取网卡累计接收、发送字节数
+        """
+        try:
+            with open("/proc/net/dev", encoding="utf-8") as f:
+                for line in f:
+                    name, sep, counters = line.partition(":")
+                    if sep and name.strip() == interface:
+                        fields = counters.split()
+                        return int(fields[0]), int(fields[8])
+        except (OSError, ValueError, IndexError) as e:
+            logger.error(f"读取网卡 {interface} 流量失败：{str(e)}")
+        return None
+
+    def sample(self) -> bool:
+        """
+        采样网卡流量，计算两次采样间的实测速率；间隔过短时沿用上次结果
+        """
+        counters = self.read_counters(self.interface)
+        if not counters:
+            return False
+        now = time.monotonic()
+        if self._sample and now - self._sample[0] < 1:
+            return True
+        if self._sample:
+            elapsed = now - self._sample[0]
+            self.rates = {
+                # 计数器回绕或网卡重置时按0计算
+                "down": max(counters[0] - self._sample[1], 0) * 8 / elapsed,
+                "up": max(counters[1] - self._sample[2], 0) * 8 / elapsed
+            }
+        self._sample = (now, counters[0], counters[1])
+        return True
+
+    def update(self, direction: str, bandwidth: float, initial: float) -> float:
+        """
+        按实测速率调整限速（KiB/s），开环估算值作为前馈
+        :param direction: up/down
+        :param bandwidth: 线路带宽（bps）
+        :param initial: 开环估算的限速（KiB/s）
+        """
+        state = self.state.get(direction)
+        now = time.monotonic()
+        upper = bandwidth / 8 / 1024
+        if not state or not self._sample:
+            self.state[direction] = {"output": initial, "integral": 0, "error": 0, "proportional": 0,
+                                     "feedforward": initial, "time": now, "target": 0, "measured": 0}
+            return initial
+        elapsed = now - state["time"]
+        if elapsed < 1:
+            return state["output"]
+        if elapsed > self.STALE * self.max_interval:
+            # 距上次调整过久，实测速率是长时间的平均值，本次不做修正，只按前馈和已有积分输出
+            output = round(min(max(initial + state["integral"], 1), upper), 2)
+            state.update({"output": output, "feedforward": initial, "proportional": 0, "time": now})
+            return output
+        # 目标占用与误差（KiB/s）
+        target = bandwidth * (1 - self.headroom / 100) / 8 / 1024
+        measured = self.rates.get(direction, 0) / 8 / 1024
+        error = target - measured
+        proportional = self.kp * error
+        integral = state["integral"]
+        candidate = integral + min(self.ki * min(elapsed, self.min_interval), self.MAX_STEP) * error
+        # 条件积分：输出已饱和且误差继续推向饱和方向时停止积分
+        unclamped = initial + proportional + candidate
+        if not ((unclamped > upper and error > 0) or (unclamped < 1 and error < 0)):
+            integral = candidate
+        output = round(min(max(initial + proportional + integral, 1), upper), 2)
+        self.state[direction] = {"output": output, "integral": round(integral, 2), "error": round(error, 2),
+                                 "proportional": round(proportional, 2), "feedforward": initial, "time": now,
+                                 "target": round(target, 2), "measured": round(measured, 2)}
+        return output
+
+    def track(self, direction: str, applied: float):
+        """
+        限速被保持时按实际生效值反算积分项，保持期间不继续累积积分
+        """
+        state = self.state.get(direction)
+        if state and applied and applied != state["output"]:
+            state["integral"] = round(applied - state["feedforward"] - state["proportional"], 2)
+            state["output"] = applied
+
+    def reset(self):
+        self.state = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "interface": self.interface,
+            "headroom": self.headroom,
+            "kp": self.kp,
+            "ki": self.ki,
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+            "rates": {direction: round(rate / 10 ** 6, 2) for direction, rate in self.rates.items()},
+            "state": {direction: {key: value for key, value in state.items() if key != "time"}
+                      for direction, state in self.state.items()}
+        }
+
+
+class BandwidthAllocator:
+    """
+    多下载器带宽分配，按权重做最大最小公平分配，空闲下载器用不完的份额分给繁忙的下载器
+    """
+    # 实际速率达到分配值的比例视为繁忙
+    BUSY_RATIO = 0.9
+    # 非繁忙下载器预留的增长空间
+    GROWTH = 1.2
+    # 非繁忙下载器至少保留公平份额的比例，便于重新提速
+    FLOOR = 0.1
+
+    def __init__(self, ratio: str, downloaders: List[str]):
+        # {下载器: 权重}，权重为0表示不限速
+        self.weights = self.parse_weights(ratio, downloaders)
+
+    @staticmethod
+    def parse_weights(ratio: str, downloaders: List[str]) -> Dict[str, int]:
+        """
+        解析分配比例，未设置时平均分配，数量不足的按1补齐
+        """
+        weights = [int(i) for i in re.split(r'[:：,，;；\s\-|./]+', ratio.strip()) if i] if ratio else []
+        if weights and len(weights) != len(downloaders):
+            logger.warning(f"分配比例 {ratio} 与下载器数量 {len(downloaders)} 不一致")
+        weights += [1] * (len(downloaders) - len(weights))
+        return dict(zip(downloaders, weights))
+
+    def allocate(self, limit: float, rates: Dict[str, Optional[float]], current: Dict[str, int]) -> Dict[str, int]:
+        """
+        分配总限速
+        :param limit: 总限速（KiB/s），0表示不限速
+        :param rates: 各可用下载器当前速率（KiB/s），无法获取时为None
+        :param current: 各下载器当前限速（KiB/s）
+        :return: {下载器: 限速}，0表示不限速
+        """
+        allocation = {name: 0 for name in rates}
+        members = [name for name in rates if self.weights.get(name)]
+        if not limit or limit <= 0 or not members:
+            return allocation
+        # 估算需求：速率未知或已接近分配值的视为无上限
+        demand = {}
+        member_weight = sum(self.weights[name] for name in members)
+        for name in members:
+            rate, allocated = rates.get(name), current.get(name)
+            if rate is None or not allocated or rate >= allocated * self.BUSY_RATIO:
+                demand[name] = float("inf")
+            else:
+                demand[name] = max(rate * self.GROWTH, limit * self.weights[name] / member_weight * self.FLOOR)
+        # 注水分配
+        shares = {}
+        remaining = float(limit)
+        unsatisfied = list(members)
+        while unsatisfied:
+            total_weight = sum(self.weights[name] for name in unsatisfied)
+            fair = {name: remaining * self.weights[name] / total_weight for name in unsatisfied}
+            satisfied = [name for name in unsatisfied if demand[name] <= fair[name]]
+            if not satisfied:
+                shares.update(fair)
+                remaining = 0
+                break
+            for name in satisfied:
+                shares[name] = demand[name]
+                remaining -= demand[name]
+                unsatisfied.remove(name)
+        if remaining > 0:
+            # 需求均已满足，剩余按权重分配，保持总量
+            total_weight = sum(self.weights[name] for name in members)
+            for name in members:
+                shares[name] += remaining * self.weights[name] / total_weight
+        allocation.update({name: max(int(share), 1) for name, share in shares.items()})
+        return allocation
+
+
+class MetricHistory:
+    """
+    码率与限速历史，每个精度一组预分配的环形数组，同一时间段内的采样取平均，内存占用固定
+    """
+    METRICS = ("total", "up", "down", "limit_up", "limit_down", "sessions")
+    # 名称: (时间段秒数, 槽位数)
+    TIERS = {
+        "1h": (10, 360),
+        "24h": (300, 288),
+        "7d": (1800, 336)
+    }
+
+    def __init__(self):
+        # {精度: {"time": 时间段, "count": 采样数, 指标: 平均值}}
+        self._tiers: Dict[str, Dict[str, array]] = {
+            name: self.__new_tier(size) for name, (_, size) in self.TIERS.items()
+        }
+        self._lock = Lock()
+
+    def __new_tier(self, size: int) -> Dict[str, array]:
+        tier = {"time": array("q", bytes(8 * size)), "count": array("I", bytes(4 * size))}
+        for metric in self.METRICS:
+            tier[metric] = array("d", bytes(8 * size))
+        return tier
+
+    def record(self, values: Dict[str, float], now: float = None) -> bool:
+        """
+        记录一次采样，返回24h精度是否进入新的时间段，用于定期保存
+        """
+        now = now or time.time()
+        rolled = False
+        with self._lock:
+            for name, (period, size) in self.TIERS.items():
+                tier = self._tiers[name]
+                bucket = int(now // period)
+                index = bucket % size
+                if tier["time"][index] != bucket:
+                    # 新时间段覆盖旧槽位
+                    tier["time"][index] = bucket
+                    tier["count"][index] = 0
+                    for metric in self.METRICS:
+                        tier[metric][index] = 0
+                    rolled = rolled or name == "24h"
+                count = tier["count"][index] + 1
+                tier["count"][index] = count
+                for metric in self.METRICS:
+                    tier[metric][index] += (float(values.get(metric) or 0) - tier[metric][index]) / count
+        return rolled
+
+    def series(self, name: str) -> Optional[dict]:
+        """
+        按时间顺序返回一个精度的数据
+        """
+        if name not in self.TIERS:
+            return None
+        period, size = self.TIERS[name]
+        with self._lock:
+            tier = self._tiers[name]
+            oldest = int(time.time() // period) - size + 1
+            slots = sorted((tier["time"][i], i) for i in range(size) if tier["time"][i] >= oldest)
+            data = {"period": period, "time": [bucket * period for bucket, _ in slots]}
+            for metric in self.METRICS:
+                data[metric] = [round(tier[metric][i], 2) for _, i in slots]
+        return data
+
+    def dump(self) -> dict:
+        """
+        序列化为压缩后的base64，用于保存
+        """
+        with self._lock:
+            return {
+                name: base64.b64encode(zlib.compress(b"".join(
+                    tier[key].tobytes() for key in ("time", "count") + self.METRICS))).decode()
+                for name, tier in self._tiers.items()
+            }
+
+    @classmethod
+    def load(cls, data: Optional[dict]) -> "MetricHistory":
+        history = cls()
+        for name, content in (data or {}).items():
+            if name not in history._tiers:
+                continue
+            try:
+                raw = zlib.decompress(base64.b64decode(content))
+                tier = history.__new_tier(cls.TIERS[name][1])
+                offset = 0
+                for key in ("time", "count") + cls.METRICS:
+                    length = len(tier[key]) * tier[key].itemsize
+                    if offset + length > len(raw):
+                        raise ValueError("数据长度不一致")
+                    tier[key] = array(tier[key].typecode, raw[offset:offset + length])
+                    offset += length
+                history._tiers[name] = tier
+            except (ValueError, zlib.error) as e:
+                logger.warning(f"播放限速历史数据 {name} 读取失败：{str(e)}")
+        return history
+
+
 class SpeedLimiterMod(_PluginBase):
     # 插件名称
     plugin_name = "播放限速与通知·自用修改"
@@ -22,7 +597,7 @@ class SpeedLimiterMod(_PluginBase):
     # 插件图标
     plugin_icon = "https://raw.githubusercontent.com/justzerock/MoviePilot-Plugins/main/icons/speed.png"
     # 插件版本
-    plugin_version = "1.3"
+    plugin_version = "2.8"
     # 插件作者
     plugin_author = "justzerock"
     # 作者主页
@@ -43,11 +618,17 @@ class SpeedLimiterMod(_PluginBase):
     _enabled: bool = False
     _notify: bool = False
     _interval: int = 60
+    # 自适应检查：最短间隔、当前间隔、上次检查时间
+    _interval_min: int = 10
+    _current_interval: float = 10
+    _last_check: float = 0
     _notify_delay: int = 0  
     _notify_title: str = ""
     _notify_text_speed: str = ""
     _notify_link: str = ""
     _playing_items: list = []
+    # 当前播放会话
+    _sessions: List[PlayingSession] = []
     _total_bit_rate_up: float = 0
     _total_bit_rate_down: float = 0
     _total_bit_rate: float = 0
@@ -60,31 +641,122 @@ class SpeedLimiterMod(_PluginBase):
     _bandwidth_down: float = 0
     _allocation_ratio_up: str = ""
     _allocation_ratio_down: str = ""
+    # 多下载器带宽分配
+    _allocators: Dict[str, BandwidthAllocator] = {}
     _auto_limit: bool = False
+    # 智能限速平滑：码率下降时的EWMA系数、放宽限速的最小变化量（KiB/s）与最短保持时间（秒）
+    _smoothing: float = 0.3
+    _min_change: float = 256
+    _dwell: int = 30
+    # 平滑后的码率
+    _smoothed_bit_rate: Dict[str, float] = {"up": 0, "down": 0}
+    # 当前生效的智能限速 (上行, 下行) 与变更时间
+    _applied_limit: Optional[Tuple[float, float]] = None
+    _limit_changed_at: float = 0
+    # 闭环限速控制器，未启用时为None
+    _controller: Optional[BandwidthController] = None
     _limit_enabled: bool = False
     # 不限速地址
     _unlimited_ips = {}
+    _address_classifier: AddressClassifier = AddressClassifier()
     # 当前限速状态
-    _current_state = ""
+    # 当前限速目标
+    _limit_state = ""
+    # 各下载器实际生效的限速 {下载器: (上行, 下行)}
+    _current_state: Dict[str, Tuple[int, int]] = {}
+    # 各下载器最近一次设置失败的原因
+    _apply_errors: Dict[str, str] = {}
+    # 设置中的任务 {下载器: (Future, 限速)}
+    _applying: Dict[str, Tuple[Future, Tuple[int, int]]] = {}
+    _apply_executor: ThreadPoolExecutor = None
+    # 每次检查读取速率与设置限速共用的下载器接口超时（秒），读取速率最多占用 _rate_timeout
+    _apply_timeout: float = 5
+    _rate_timeout: float = 2
+    # 当前各下载器限速 {下载器: (上行, 下行)}
+    _allocations: Dict[str, Tuple[int, int]] = {}
     _include_path_up = ""
     _include_path_down = ""
+    _path_matcher: PathMatcher = PathMatcher()
+    # 配置页面缓存 (key, schema)
+    _form_cache: tuple = None
+    # 各媒体服务器会话转换
+    _session_adapters = {
+        "emby": PlayingSession.from_emby,
+        "jellyfin": PlayingSession.from_jellyfin,
+        "plex": PlayingSession.from_plex
+    }
+    # 码率与限速历史
+    _history: MetricHistory = None
+    # 每次检查后保存的状态快照，详情页只读取快照
+    _snapshot: dict = {}
+    # 各服务最近一次错误 {(类型, 名称): (时间, 原因)}
+    _service_errors: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    # 详情页缓存 (快照, 页面)
+    _page_cache: tuple = None
+    # 服务注册表 {类型: {名称: 服务信息}}，下载器和媒体服务器分开保存，健康检查时重新解析
+    _registry: Dict[str, Dict[str, ServiceInfo]] = {}
+    _service_kinds = {"downloader": "下载器", "mediaserver": "媒体服务器"}
+    # 服务健康状态 {(类型, 名称): 是否已连接}
+    _service_health: Dict[Tuple[str, str], bool] = {}
+    _health_interval: int = 300
+    # 注册表统计，每个实例在 init_plugin 中创建
+    _registry_stats: dict = None
+    # 媒体服务器会话查询
+    _poll_executor: ThreadPoolExecutor = None
+    _poll_timeout: float = 5
+    _session_grace: int = 180
+    # 查询中的任务 {服务器: Future}
+    _polling: Dict[str, Future] = {}
+    # 会话表 {服务器: {会话标识: 会话}}，由Webhook事件增量更新，定时查询时校正
+    _session_table: Dict[str, Dict[str, PlayingSession]] = {}
+    # 上次成功校正时间 {服务器: 时间}
+    _reconciled_at: Dict[str, float] = {}
+    # 事件无法完整更新、需要重新查询的服务器
+    _dirty_servers: set = set()
+    _session_lock = Lock()
+    # 事件合并窗口
+    _event_window: float = 2
+    _evaluation_timer: Optional[threading.Timer] = None
+    _evaluation_lock = Lock()
+    # 串行执行限速评估
+    _limit_lock = Lock()
+    # 查询耗时（毫秒） {服务器: 耗时}
+    _server_latency: Dict[str, float] = {}
 
     def init_plugin(self, config: dict = None):
         self.downloader_helper = DownloaderHelper()
         self.mediaserver_helper = MediaServerHelper()
+        self._registry = {}
+        self._service_health = {}
+        self._registry_stats = {"lookups": {"downloader": 0, "mediaserver": 0},
+                                "checks": 0, "latency": {}, "last_check": None}
         # 读取配置
         if config:
             self._enabled = config.get("enabled")
             self._notify = config.get("notify")
             self._interval = int(config.get("interval")) if config.get("interval") else 60
+            self._interval_min = min(int(config.get("interval_min")) if config.get("interval_min") else 10,
+                                     self._interval)
+            self._current_interval = self._interval_min
+            self._last_check = 0
             self._notify_delay = int(config.get("notify_delay")) if config.get("notify_delay") else 0
+            self._poll_timeout = float(config.get("poll_timeout")) if config.get("poll_timeout") else 5
+            self._session_grace = int(config.get("session_grace")) if config.get("session_grace") else 180
+            self._health_interval = int(config.get("health_interval")) if config.get("health_interval") else 300
+            self._event_window = float(config.get("event_window")) \
+                if config.get("event_window") not in [None, ""] else 2
             self._play_up_speed = float(config.get("play_up_speed")) if config.get("play_up_speed") else 0
             self._play_down_speed = float(config.get("play_down_speed")) if config.get("play_down_speed") else 0
             self._noplay_up_speed = float(config.get("noplay_up_speed")) if config.get("noplay_up_speed") else 0
             self._noplay_down_speed = float(config.get("noplay_down_speed")) if config.get("noplay_down_speed") else 0
-            self._current_state = f"U:{self._noplay_up_speed},D:{self._noplay_down_speed}"
+            self._limit_state = ""
+            self._allocations = {}
+            self._current_state = {}
+            self._apply_errors = {}
+            self._applying = {}
             self._include_path_up = config.get("include_path_up")
             self._include_path_down = config.get("include_path_down")
+            self._path_matcher = PathMatcher(self._include_path_up, self._include_path_down)
 
             try:
                 # 总带宽
@@ -106,12 +778,64 @@ class SpeedLimiterMod(_PluginBase):
                                            or self._auto_limit) else False
             self._allocation_ratio_up = config.get("allocation_ratio_up") or ""
             self._allocation_ratio_down = config.get("allocation_ratio_down") or ""
+            try:
+                self._allocators = {
+                    "up": BandwidthAllocator(self._allocation_ratio_up, config.get("downloader") or []),
+                    "down": BandwidthAllocator(self._allocation_ratio_down, config.get("downloader") or [])
+                }
+            except ValueError as e:
+                logger.error(f"智能分配比例设置错误：{str(e)}")
+                self._allocators = {
+                    "up": BandwidthAllocator("", config.get("downloader") or []),
+                    "down": BandwidthAllocator("", config.get("downloader") or [])
+                }
+            # 智能限速平滑
+            try:
+                self._smoothing = min(max(float(config.get("smoothing")), 0.01), 1) \
+                    if config.get("smoothing") not in [None, ""] else 0.3
+            except ValueError:
+                logger.error(f"智能限速平滑系数设置错误：{config.get('smoothing')}")
+                self._smoothing = 0.3
+            self._min_change = float(config.get("min_change")) if config.get("min_change") not in [None, ""] else 256
+            self._dwell = int(config.get("dwell")) if config.get("dwell") not in [None, ""] else 30
+            self._smoothed_bit_rate = {"up": 0, "down": 0}
+            self._applied_limit = None
+            self._limit_changed_at = 0
+            self._controller = None
+            if config.get("controller") and config.get("wan_interface"):
+                try:
+                    kp, ki = [float(i) for i in re.split(r'[,，\s]+', (config.get("controller_gains") or "0.3,0.05").strip())]
+                    headroom = float(config.get("target_headroom")) \
+                        if config.get("target_headroom") not in [None, ""] else 15
+                    self._controller = BandwidthController(config.get("wan_interface").strip(), headroom, kp, ki,
+                                                           min_interval=self._interval_min,
+                                                           max_interval=self._interval)
+                    if not self._controller.sample():
+                        logger.warning(f"网卡 {config.get('wan_interface')} 不存在，闭环限速将使用带宽估算")
+                except ValueError as e:
+                    logger.error(f"闭环限速参数设置错误：{str(e)}")
             # 不限速地址
             self._unlimited_ips["ipv4"] = config.get("ipv4") or ""
             self._unlimited_ips["ipv6"] = config.get("ipv6") or ""
+            self._address_classifier = AddressClassifier(self._unlimited_ips["ipv4"], self._unlimited_ips["ipv6"])
 
             self._downloader = config.get("downloader") or []
 
+            self.stop_service()
+            self._history = MetricHistory.load(self.get_data("history"))
+            self._snapshot = {}
+            self._service_errors = {}
+            self._page_cache = None
+            # 解析下载器和媒体服务器，并立即检查一次连接状态
+            self.check_service_health()
+            self._polling = {}
+            self._session_table = {}
+            self._reconciled_at = {}
+            self._dirty_servers = set()
+            self._server_latency = {}
+            self._poll_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speedlimitermod-poll")
+            self._apply_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speedlimitermod-apply")
+
             self.check_playing_sessions()
 
     def get_state(self) -> bool:
@@ -122,7 +846,35 @@ class SpeedLimiterMod(_PluginBase):
         pass
 
     def get_api(self) -> List[Dict[str, Any]]:
-        pass
+        """
+        获取插件API
+        [{
+            "path": "/xx",
+            "endpoint": self.xxx,
+            "methods": ["GET", "POST"],
+            "summary": "API说明"
+        }]
+        """
+        return [
+            {
+                "path": "/state",
+                "endpoint": self.limiter_state,
+                "methods": ["GET"],
+                "summary": "播放限速检查状态"
+            },
+            {
+                "path": "/history",
+                "endpoint": self.history,
+                "methods": ["GET"],
+                "summary": "播放码率与限速历史"
+            },
+            {
+                "path": "/registry",
+                "endpoint": self.registry_stats,
+                "methods": ["GET"],
+                "summary": "播放限速服务注册表状态"
+            }
+        ]
 
     def get_service(self) -> List[Dict[str, Any]]:
         """
@@ -135,19 +887,36 @@ class SpeedLimiterMod(_PluginBase):
             "kwargs": {} # 定时器参数
         }]
         """
+        services = []
         if self._enabled and self._limit_enabled and self._interval:
-            return [
-                {
-                    "id": "AdvancedSpeedLimiter",
-                    "name": "播放限速检查服务",
-                    "trigger": "interval",
-                    "func": self.check_playing_sessions,
-                    "kwargs": {"seconds": self._interval}
-                }
-            ]
-        return []
+            services.append({
+                "id": "AdvancedSpeedLimiter",
+                "name": "播放限速检查服务",
+                "trigger": "interval",
+                "func": self.adaptive_check,
+                "kwargs": {"seconds": self._interval_min}
+            })
+        if self._enabled:
+            services.append({
+                "id": "AdvancedSpeedLimiterHealth",
+                "name": "播放限速服务健康检查",
+                "trigger": "interval",
+                "func": self.check_service_health,
+                "kwargs": {"seconds": self._health_interval}
+            })
+        return services
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
+        downloader_names = tuple(config.name for config in self.downloader_helper.get_configs().values())
+        form_key = (self.plugin_version, downloader_names)
+        if not self._form_cache or self._form_cache[0] != form_key:
+            self._form_cache = (form_key, self.__build_form(downloader_names))
+        return self._form_cache[1]
+
+    def __build_form(self, downloader_names: tuple) -> Tuple[List[dict], Dict[str, Any]]:
+        """
+        拼装插件配置页面
+        """
         return [
             {
                 'component': 'VForm',
@@ -196,15 +965,32 @@ class SpeedLimiterMod(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'interval_min',
+                                            'label': '最短检查间隔（秒）',
+                                            'placeholder': '播放中或限速变化时的检查间隔，默认 10秒'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
                                 },
                                 'content': [
                                     {
                                         'component': 'VTextField',
                                         'props': {
                                             'model': 'interval',
-                                            'label': '定时检查间隔（秒）',
-                                            'placeholder': '定时检查间隔，默认 60秒'
+                                            'label': '最长检查间隔（秒）',
+                                            'placeholder': '空闲时逐步延长到此间隔，默认 60秒'
                                         }
                                     }
                                 ]
@@ -213,7 +999,7 @@ class SpeedLimiterMod(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -228,6 +1014,79 @@ class SpeedLimiterMod(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'poll_timeout',
+                                            'label': '媒体服务器查询超时（秒）',
+                                            'placeholder': '超时的服务器本次跳过，默认 5秒'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'session_grace',
+                                            'label': '会话保留时间（秒）',
+                                            'placeholder': '查询失败时沿用上次会话的时长，默认 180秒'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'health_interval',
+                                            'label': '服务健康检查间隔（秒）',
+                                            'placeholder': '后台检查下载器和媒体服务器连接，默认 300秒'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'event_window',
+                                            'label': '播放事件合并窗口（秒）',
+                                            'placeholder': '窗口内的播放事件只评估一次限速，0 为立即评估'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -245,8 +1104,8 @@ class SpeedLimiterMod(_PluginBase):
                                             'clearable': True,
                                             'model': 'downloader',
                                             'label': '下载器',
-                                            'items': [{"title": config.name, "value": config.name}
-                                                      for config in self.downloader_helper.get_configs().values()]
+                                            'items': [{"title": name, "value": name}
+                                                      for name in downloader_names]
                                         }
                                     }
                                 ]
@@ -332,6 +1191,134 @@ class SpeedLimiterMod(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'smoothing',
+                                            'label': '智能限速平滑系数',
+                                            'placeholder': '码率下降时的平滑系数 0~1，越小释放越慢，默认 0.3'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'min_change',
+                                            'label': '智能限速最小调整（KiB/s）',
+                                            'placeholder': '放宽限速的最小变化量，默认 256'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'dwell',
+                                            'label': '智能限速最短保持（秒）',
+                                            'placeholder': '两次放宽限速的最短间隔，默认 30秒'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'controller',
+                                            'label': '闭环智能限速',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'wan_interface',
+                                            'label': '外网网卡',
+                                            'placeholder': '例如 eth0，按 /proc/net/dev 实际流量调整限速'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'target_headroom',
+                                            'label': '目标余量（%）',
+                                            'placeholder': '线路保留的带宽比例，默认 15'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'controller_gains',
+                                            'label': '控制参数 Kp,Ki',
+                                            'placeholder': '默认 0.3,0.05'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -495,6 +1482,11 @@ class SpeedLimiterMod(_PluginBase):
             "notify": True,
             "interval": 60,
             "notify_delay": 0,
+            "interval_min": 10,
+            "poll_timeout": 5,
+            "session_grace": 180,
+            "health_interval": 300,
+            "event_window": 2,
             "downloader": [],
             "play_up_speed": None,
             "play_down_speed": None,
@@ -504,6 +1496,13 @@ class SpeedLimiterMod(_PluginBase):
             "bandwidth_down": None,
             "allocation_ratio_up": "",
             "allocation_ratio_down": "",
+            "smoothing": 0.3,
+            "min_change": 256,
+            "dwell": 30,
+            "controller": False,
+            "wan_interface": "",
+            "target_headroom": 15,
+            "controller_gains": "0.3,0.05",
             "ipv4": "",
             "ipv6": "",
             "include_path_up": "",
@@ -511,53 +1510,275 @@ class SpeedLimiterMod(_PluginBase):
         }
 
     def get_page(self) -> List[dict]:
-        pass
+        """
+        拼装插件详情页面，只使用最近一次检查的快照，不查询媒体服务器和下载器
+        """
+        snapshot = self._snapshot
+        if not snapshot:
+            return [
+                {
+                    'component': 'div',
+                    'text': '暂无数据',
+                    'props': {
+                        'class': 'text-center',
+                    }
+                }
+            ]
+        if not self._page_cache or self._page_cache[0] is not snapshot:
+            self._page_cache = (snapshot, self.__build_page(snapshot))
+        return self._page_cache[1]
+
+    @staticmethod
+    def __build_page(snapshot: dict) -> List[dict]:
+        """
+        拼装状态页面
+        """
+
+        def mbps(bit_rate: float) -> str:
+            return f"{round((bit_rate or 0) / 10 ** 6, 1)} Mbps"
+
+        def speed(limit: Optional[int]) -> str:
+            if limit is None:
+                return "-"
+            if limit <= 0:
+                return "∞"
+            return f"{round(limit / 1024, 1)} MiB/s" if limit >= 1024 else f"{limit} KiB/s"
+
+        def table(headers: List[str], rows: List[List[str]], empty: str) -> dict:
+            return {
+                'component': 'VTable',
+                'props': {
+                    'hover': True,
+                    'density': 'compact'
+                },
+                'content': [
+                    {
+                        'component': 'thead',
+                        'content': [
+                            {
+                                'component': 'tr',
+                                'content': [{'component': 'th', 'text': header} for header in headers]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'tbody',
+                        'content': [
+                            {
+                                'component': 'tr',
+                                'content': [{'component': 'td', 'text': cell} for cell in row]
+                            } for row in rows
+                        ] or [
+                            {
+                                'component': 'tr',
+                                'content': [
+                                    {
+                                        'component': 'td',
+                                        'props': {
+                                            'colspan': len(headers),
+                                            'class': 'text-center'
+                                        },
+                                        'text': empty
+                                    }
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }
+
+        def card(title: str, content: List[dict]) -> dict:
+            return {
+                'component': 'VCard',
+                'props': {
+                    'class': 'mb-3'
+                },
+                'content': [
+                    {
+                        'component': 'VCardTitle',
+                        'text': title
+                    },
+                    {
+                        'component': 'VCardText',
+                        'content': content
+                    }
+                ]
+            }
+
+        sources = {PlayingSession.TRANSCODE: "转码", PlayingSession.BANDWIDTH: "实测", PlayingSession.SOURCE: "源文件"}
+        sparkline = snapshot.get("sparkline") or {}
+        return [
+            card(f"播放状态（{snapshot.get('time')}）", [
+                {
+                    'component': 'div',
+                    'text': f"总码率 {mbps(snapshot.get('total'))} | 上行限速码率 {mbps(snapshot.get('up'))} | "
+                            f"下行限速码率 {mbps(snapshot.get('down'))} | 限速目标 {snapshot.get('limit') or '-'} | "
+                            f"检查间隔 {snapshot.get('interval')} 秒"
+                },
+                {
+                    'component': 'VApexChart',
+                    'props': {
+                        'height': 160,
+                        'options': {
+                            'chart': {
+                                'type': 'area',
+                                'sparkline': {
+                                    'enabled': True
+                                }
+                            },
+                            'stroke': {
+                                'curve': 'smooth',
+                                'width': 2
+                            },
+                            'xaxis': {
+                                'type': 'datetime'
+                            },
+                            'tooltip': {
+                                'x': {
+                                    'format': 'HH:mm:ss'
+                                }
+                            }
+                        },
+                        'series': [
+                            {
+                                'name': '总码率（Mbps）',
+                                'data': [[t * 1000, round(v / 10 ** 6, 2)]
+                                         for t, v in zip(sparkline.get("time", []), sparkline.get("total", []))]
+                            },
+                            {
+                                'name': '上行限速码率（Mbps）',
+                                'data': [[t * 1000, round(v / 10 ** 6, 2)]
+                                         for t, v in zip(sparkline.get("time", []), sparkline.get("up", []))]
+                            }
+                        ]
+                    }
+                }
+            ]),
+            card("播放会话", [
+                table(["用户", "标题", "码率", "码率来源", "地址", "状态"], [
+                    [session.get("user"), session.get("title"), mbps(session.get("bitrate")),
+                     sources.get(session.get("bitrate_source"), "-"), session.get("address") or "-",
+                     "暂停" if session.get("paused") else "播放中"]
+                    for session in snapshot.get("sessions") or []
+                ], "当前没有播放")
+            ]),
+            card("下载器限速", [
+                table(["下载器", "目标上行", "目标下行", "生效上行", "生效下行", "状态"], [
+                    [name, speed((info.get("target") or (None, None))[0]), speed((info.get("target") or (None, None))[1]),
+                     speed((info.get("applied") or (None, None))[0]), speed((info.get("applied") or (None, None))[1]),
+                     info.get("error") or ("已生效" if info.get("applied") == info.get("target") else "待设置")]
+                    for name, info in (snapshot.get("downloaders") or {}).items()
+                ], "没有可用的下载器")
+            ]),
+            card("服务状态", [
+                table(["服务", "类型", "连接", "耗时", "最近错误"], [
+                    [info.get("name"), f"{SpeedLimiterMod._service_kinds.get(info.get('kind'))} {info.get('type')}",
+                     "已连接" if info.get("active") else "未连接",
+                     f"{info.get('latency')} ms" if info.get("latency") is not None else "-",
+                     " ".join(info.get("error") or ()) or "-"]
+                    for info in snapshot.get("services") or []
+                ], "没有可用的服务")
+            ])
+        ]
 
     @property
     def service_infos(self) -> Optional[Dict[str, ServiceInfo]]:
         """
-        服务信息
+        服务信息，从注册表中返回已连接的下载器
         """
-        if not self._downloader:
-            logger.warning("尚未配置下载器，请检查配置")
+        self._registry_stats["lookups"]["downloader"] += 1
+        health = self._service_health
+        active_services = {name: service for name, service in self._registry.get("downloader", {}).items()
+                           if health.get(("downloader", name))}
+        if not active_services:
             return None
+        return active_services
 
-        downloader_services = self.downloader_helper.get_services(name_filters=self._downloader)
-        if not downloader_services:
-            logger.warning("获取下载器实例失败，请检查配置")
-            return None
-        
-        media_services = self.mediaserver_helper.get_services()
-        if not media_services:
-            logger.warning("获取媒体服务器实例失败，请检查配置")
-            return None
+    @property
+    def media_servers(self) -> Dict[str, ServiceInfo]:
+        """
+        已连接的媒体服务器
+        """
+        self._registry_stats["lookups"]["mediaserver"] += 1
+        health = self._service_health
+        return {name: service for name, service in self._registry.get("mediaserver", {}).items()
+                if health.get(("mediaserver", name))}
 
-        active_services = {}
-        for service_name, service_info in downloader_services.items():
-            if service_info.instance.is_inactive():
-                logger.warning(f"下载器 {service_name} 未连接，请检查配置")
-            else:
-                active_services[service_name] = service_info
+    def __registered_services(self) -> List[Tuple[str, str, ServiceInfo]]:
+        """
+        注册表中的全部服务 [(类型, 名称, 服务信息)]
+        """
+        return [(kind, name, service) for kind, services in self._registry.items()
+                for name, service in services.items()]
 
-        for service_name, service_info in media_services.items():
-            if service_info.instance.is_inactive():
-                logger.warning(f"媒体服务器 {service_name} 未连接，请检查配置")
-            else:
-                active_services[service_name] = service_info
-                # logger.info(f"媒体服务器: {service_info}")
+    def check_service_health(self):
+        """
+        后台检查服务连接状态，查询服务时直接读取结果
+        每次检查都通过帮助类重新获取服务，MoviePilot重载模块后使用新的服务实例
+        """
+        first_check = not self._registry_stats.get("checks")
+        downloader_services = {}
+        if not self._downloader:
+            if first_check:
+                logger.warning("尚未配置下载器，请检查配置")
+        else:
+            downloader_services = self.downloader_helper.get_services(name_filters=self._downloader) or {}
+            if not downloader_services and first_check:
+                logger.warning("获取下载器实例失败，请检查配置")
+        media_services = self.mediaserver_helper.get_services() or {}
+        if not media_services and first_check:
+            logger.warning("获取媒体服务器实例失败，请检查配置")
+        registry = {"downloader": downloader_services, "mediaserver": media_services}
 
-        if not active_services:
-            logger.warning("没有已连接的下载器，请检查配置")
-            return None
+        health = {}
+        latency = {}
+        for kind, services in registry.items():
+            for service_name, service_info in services.items():
+                key = (kind, service_name)
+                start = time.perf_counter()
+                try:
+                    health[key] = not service_info.instance.is_inactive()
+                except Exception as e:
+                    logger.error(f"检查服务 {service_name} 连接状态失败：{str(e)}")
+                    health[key] = False
+                latency[key] = round((time.perf_counter() - start) * 1000, 1)
+                if not health[key] and self._service_health.get(key) is not False:
+                    logger.warning(f"{self._service_kinds[kind]} {service_name} 未连接，请检查配置")
+                    self.__record_error(kind, service_name, "未连接")
+                elif health[key] and self._service_health.get(key) is False:
+                    logger.info(f"{self._service_kinds[kind]} {service_name} 已恢复连接")
+        self._registry = registry
+        self._service_health = health
+        self._registry_stats["checks"] = self._registry_stats.get("checks", 0) + 1
+        self._registry_stats["latency"] = latency
+        self._registry_stats["last_check"] = time.strftime("%Y-%m-%d %H:%M:%S")
 
-        return active_services
+    def registry_stats(self, apikey: str):
+        """
+        服务注册表状态：连接状态、查询次数与健康检查耗时
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data={
+            "services": [{
+                "name": name,
+                "kind": kind,
+                "type": service.type,
+                "active": self._service_health.get((kind, name), False),
+                "latency": self._registry_stats.get("latency", {}).get((kind, name))
+            } for kind, name, service in self.__registered_services()],
+            "lookups": dict(self._registry_stats.get("lookups")),
+            "checks": self._registry_stats.get("checks", 0),
+            "last_check": self._registry_stats.get("last_check")
+        })
 
     @eventmanager.register(EventType.WebhookMessage)
     def check_playing_sessions(self, event: Event = None):
         """
         检查播放会话
         """
-        if not self.service_infos:
+        service_infos = self.service_infos
+        if not service_infos:
             return
         if not self._enabled:
             return
@@ -575,161 +1796,345 @@ class SpeedLimiterMod(_PluginBase):
             else:
                 self._notify_title += self.__get_play_history(event_data)
                 logger.info(self.__get_play_history(event_data))
-                embyservice = self.service_infos.get(event_data.server_name)
+                embyservice = self.media_servers.get(event_data.server_name)
                 if embyservice:
                     self._notify_link = embyservice.instance.get_play_url(event_data.item_id)
+                # 更新会话表，合并窗口内的事件只评估一次
+                self.__apply_event(event_data)
+                self.__schedule_evaluation()
+                return
 
-        # 当前播放的总比特率
-        total_bit_rate_up = 0
-        total_bit_rate_down = 0
-        total_bit_rate = 0
-        playing_items = []
-        media_servers = self.mediaserver_helper.get_services()
+        media_servers = self.media_servers
         if not media_servers:
             return
-        # 查询所有媒体服务器状态
+        # 并发查询所有媒体服务器的播放中会话，校正会话表
+        self.__reconcile(media_servers)
+        self.__evaluate()
+
+    def adaptive_check(self):
+        """
+        按最短间隔触发，未到当前检查间隔时跳过
+        """
+        if time.time() - self._last_check < self._current_interval:
+            return
+        self._last_check = time.time()
+        self.check_playing_sessions()
+
+    def __adapt_interval(self, active: bool):
+        """
+        有播放或限速变化时恢复最短间隔，空闲时间隔逐次翻倍，不超过最长间隔
+        """
+        if active:
+            interval = self._interval_min
+        else:
+            interval = min(self._current_interval * 2, self._interval)
+        if interval != self._current_interval:
+            logger.debug(f"播放限速检查间隔调整为 {interval} 秒")
+        self._current_interval = interval
+
+    def history(self, apikey: str, tier: str = "1h"):
+        """
+        码率与限速历史，tier 可选 1h/24h/7d，码率单位 bps，限速单位 KiB/s
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if not self._history:
+            return schemas.Response(success=False, message="插件未启用")
+        data = self._history.series(tier)
+        if data is None:
+            return schemas.Response(success=False, message=f"不支持的精度：{tier}")
+        return schemas.Response(success=True, data=data)
+
+    def __record_error(self, kind: str, name: str, message: str):
+        self._service_errors[(kind, name)] = (time.strftime("%Y-%m-%d %H:%M:%S"), message)
+
+    def __take_snapshot(self):
+        """
+        保存本次检查结果的快照，供详情页使用
+        """
+        # 媒体服务器优先使用最近一次会话查询耗时
+        latency = dict(self._registry_stats.get("latency") or {})
+        latency.update({("mediaserver", name): value for name, value in self._server_latency.items()})
+        self._snapshot = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "total": self._total_bit_rate,
+            "up": self._total_bit_rate_up,
+            "down": self._total_bit_rate_down,
+            "limit": self._limit_state,
+            "interval": self._current_interval,
+            "sessions": [{
+                "user": session.user,
+                "title": session.title,
+                "bitrate": session.bitrate,
+                "bitrate_source": session.bitrate_source,
+                "address": session.address,
+                "paused": session.paused
+            } for session in self._sessions],
+            "downloaders": {
+                name: {
+                    "target": self._allocations.get(name),
+                    "applied": self._current_state.get(name),
+                    "error": self._apply_errors.get(name)
+                } for name in self._downloader
+            },
+            "services": [{
+                "name": name,
+                "kind": kind,
+                "type": service.type,
+                "active": self._service_health.get((kind, name), False),
+                "latency": latency.get((kind, name)),
+                "error": self._service_errors.get((kind, name))
+            } for kind, name, service in self.__registered_services()],
+            "sparkline": self._history.series("1h") if self._history else {}
+        }
+
+    def __record_history(self):
+        """
+        记录本次检查结果，每个24h精度时间段保存一次
+        """
+        if not self._history:
+            return
+        applied = [limits for name, limits in self._current_state.items() if name in self._allocations]
+        rolled = self._history.record({
+            "total": self._total_bit_rate,
+            "up": self._total_bit_rate_up,
+            "down": self._total_bit_rate_down,
+            "limit_up": sum(limits[0] for limits in applied),
+            "limit_down": sum(limits[1] for limits in applied),
+            "sessions": len(self._playing_items)
+        })
+        if rolled:
+            self.save_data("history", self._history.dump())
+
+    def limiter_state(self, apikey: str):
+        """
+        当前检查间隔与限速状态
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data={
+            "interval": self._current_interval,
+            "interval_min": self._interval_min,
+            "interval_max": self._interval,
+            "last_check": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._last_check))
+            if self._last_check else None,
+            "next_check": time.strftime("%Y-%m-%d %H:%M:%S",
+                                        time.localtime(self._last_check + self._current_interval))
+            if self._last_check else None,
+            "sessions": len(self._playing_items),
+            "limit": self._limit_state,
+            "downloaders": {
+                name: {
+                    "target": self._allocations.get(name),
+                    "applied": self._current_state.get(name),
+                    "error": self._apply_errors.get(name)
+                } for name in self._downloader
+            },
+            "controller": self._controller.to_dict() if self._controller else None
+        })
+
+    def __evaluate(self):
+        """
+        根据会话表计算码率并设置限速
+        """
+        with self._limit_lock:
+            state = dict(self._current_state)
+            media_servers = self.media_servers
+            with self._session_lock:
+                sessions = [session for server, table in self._session_table.items() if server in media_servers
+                            for session in table.values()]
+            total_bit_rate, total_bit_rate_up, total_bit_rate_down = self.__account_sessions(sessions)
+            self._sessions = sessions
+            playing_items = [session.to_dict() for session in sessions
+                             if not session.paused and session.media_type == "Video"]
+            self._playing_items = playing_items
+            self._total_bit_rate_up = total_bit_rate_up
+            self._total_bit_rate_down = total_bit_rate_down
+            self._total_bit_rate = total_bit_rate
+
+            if self._auto_limit:
+                # 智能限速按平滑后的码率计算
+                total_bit_rate_up = self.__smooth_bit_rate("up", total_bit_rate_up)
+                total_bit_rate_down = self.__smooth_bit_rate("down", total_bit_rate_down)
+
+            if total_bit_rate_up or total_bit_rate_down:
+                # 开启智能限速计算上传限速
+                if self._auto_limit:
+                    play_up_speed = self.__calc_limit(total_bit_rate_up, is_up=True)
+                    play_down_speed = self.__calc_limit(total_bit_rate_down, is_up=False)
+                    if self._controller and self._controller.sample():
+                        # 闭环限速：以实测流量修正估算值
+                        if self._bandwidth_up:
+                            play_up_speed = self._controller.update("up", self._bandwidth_up, play_up_speed)
+                        if self._bandwidth_down:
+                            play_down_speed = self._controller.update("down", self._bandwidth_down, play_down_speed)
+                    play_up_speed, play_down_speed = self.__hold_limit(play_up_speed, play_down_speed)
+                    if self._controller:
+                        # 回写保持后的限速，防止积分饱和
+                        self._controller.track("up", play_up_speed)
+                        self._controller.track("down", play_down_speed)
+                else:
+                    play_up_speed = self._play_up_speed
+                    play_down_speed = self._play_down_speed
+
+                # 当前正在播放，开始限速
+                self.__set_limiter(upload_limit=play_up_speed,
+                                   download_limit=play_down_speed)
+            else:
+                if self._auto_limit:
+                    if self._controller:
+                        # 没有播放时不做闭环控制，下次播放重新从估算值开始
+                        self._controller.reset()
+                    noplay_up_speed, noplay_down_speed = self.__hold_limit(
+                        int(self._bandwidth_up / 8 / 1024),
+                        int(self._bandwidth_down / 8 / 1024))
+                else:
+                    # 当前没有播放，取消限速
+                    noplay_up_speed = self._noplay_up_speed
+                    noplay_down_speed = self._noplay_down_speed
+
+                self.__set_limiter(upload_limit=noplay_up_speed,
+                                   download_limit=noplay_down_speed)
+            self.__record_history()
+            self.__take_snapshot()
+            # 有播放、限速有变化或有下载器待重试时保持最短间隔
+            self.__adapt_interval(active=bool(playing_items) or state != self._current_state
+                                  or any(self._current_state.get(name) != limits
+                                         for name, limits in self._allocations.items()))
+
+    def __reconcile(self, media_servers: Dict[str, ServiceInfo]):
+        """
+        查询媒体服务器，以查询结果替换会话表；查询失败超过保留时间的服务器清空会话
+        """
+        polled_sessions = self.__poll_sessions(media_servers)
+        now = time.time()
         for server, service in media_servers.items():
-            # 查询播放中会话
-            playing_sessions_up = []
-            playing_sessions_down = []
-            if service.type == "emby":
-                req_url = "[HOST]emby/Sessions?api_key=[APIKEY]"
+            adapter = self._session_adapters.get(service.type)
+            if not adapter:
+                continue
+            if server in polled_sessions:
                 try:
-                    res = service.instance.get_data(req_url)
-                    if res and res.status_code == 200:
-                        sessions = res.json()
-                        for session in sessions:
-                            # logger.info(session)
-                            if session.get("NowPlayingItem") and not session.get("PlayState", {}).get("IsPaused"):
-                                playing_items.append(self.__get_media_info(session, 'emby'))
-                                total_bit_rate += int(session.get("NowPlayingItem").get("Bitrate") or 0)
-                                if self.__path_included(session.get("NowPlayingItem").get("Path"), is_up=True):
-                                    playing_sessions_up.append(session)
-                                elif self.__path_included(session.get("NowPlayingItem").get("Path"), is_up=False):
-                                    playing_sessions_down.append(session)
-                except Exception as e:
-                    logger.error(f"获取Emby播放会话失败：{str(e)}")
+                    records = adapter(polled_sessions[server])
+                    with self._session_lock:
+                        self._session_table[server] = {record.key: record for record in records}
+                        self._reconciled_at[server] = now
+                        self._dirty_servers.discard(server)
                     continue
-                # 计算有效比特率
-                for session in playing_sessions_up:
-                    # 设置了不限速范围则判断session ip是否在不限速范围内
-                    if self._unlimited_ips["ipv4"] or self._unlimited_ips["ipv6"]:
-                        if not self.__allow_access(self._unlimited_ips, session.get("RemoteEndPoint")) \
-                                and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                            total_bit_rate_up += int(session.get("NowPlayingItem", {}).get("Bitrate") or 0)
-                    # 未设置不限速范围，则默认不限速内网ip
-                    elif not IpUtils.is_private_ip(session.get("RemoteEndPoint")) \
-                            and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                        total_bit_rate_up += int(session.get("NowPlayingItem", {}).get("Bitrate") or 0)
-                for session in playing_sessions_down:
-                    # 设置了不限速范围则判断session ip是否在不限速范围内
-                    if self._unlimited_ips["ipv4"] or self._unlimited_ips["ipv6"]:
-                        if not self.__allow_access(self._unlimited_ips, session.get("RemoteEndPoint")) \
-                                and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                            total_bit_rate_down += int(session.get("NowPlayingItem", {}).get("Bitrate") or 0)
-                    # 未设置不限速范围，则默认限速内网ip
-                    elif IpUtils.is_private_ip(session.get("RemoteEndPoint")) \
-                            and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                        total_bit_rate_down += int(session.get("NowPlayingItem", {}).get("Bitrate") or 0)
-            elif service.type == "jellyfin":
-                req_url = "[HOST]Sessions?api_key=[APIKEY]"
-                try:
-                    res = service.instance.get_data(req_url)
-                    if res and res.status_code == 200:
-                        sessions = res.json()
-                        for session in sessions:
-                            if session.get("NowPlayingItem") and not session.get("PlayState", {}).get("IsPaused"):
-                                playing_items.append(self.__get_media_info(session, 'jellyfin'))
-                                media_streams = session.get("NowPlayingItem", {}).get("MediaStreams") or []
-                                for media_stream in media_streams:
-                                    total_bit_rate += int(media_stream.get("BitRate") or 0)
-                                if self.__path_included(session.get("NowPlayingItem").get("Path"), is_up=True):
-                                    playing_sessions_up.append(session)
-                                elif self.__path_included(session.get("NowPlayingItem").get("Path"), is_up=False):
-                                    playing_sessions_down.append(session)
                 except Exception as e:
-                    logger.error(f"获取Jellyfin播放会话失败：{str(e)}")
-                    continue
-                # 计算有效比特率
-                for session in playing_sessions_up:
-                    # 设置了不限速范围则判断session ip是否在不限速范围内
-                    if self._unlimited_ips["ipv4"] or self._unlimited_ips["ipv6"]:
-                        if not self.__allow_access(self._unlimited_ips, session.get("RemoteEndPoint")) \
-                                and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                            media_streams = session.get("NowPlayingItem", {}).get("MediaStreams") or []
-                            for media_stream in media_streams:
-                                total_bit_rate_up += int(media_stream.get("BitRate") or 0)
-                    # 未设置不限速范围，则默认不限速内网ip
-                    elif not IpUtils.is_private_ip(session.get("RemoteEndPoint")) \
-                            and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                        media_streams = session.get("NowPlayingItem", {}).get("MediaStreams") or []
-                        for media_stream in media_streams:
-                            total_bit_rate_up += int(media_stream.get("BitRate") or 0)
-                for session in playing_sessions_down:
-                    # 设置了不限速范围则判断session ip是否在不限速范围内
-                    if self._unlimited_ips["ipv4"] or self._unlimited_ips["ipv6"]:
-                        if not self.__allow_access(self._unlimited_ips, session.get("RemoteEndPoint")) \
-                                and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                            media_streams = session.get("NowPlayingItem", {}).get("MediaStreams") or []
-                            for media_stream in media_streams:
-                                total_bit_rate_down += int(media_stream.get("BitRate") or 0)
-                    # 未设置不限速范围，则默认限速内网ip
-                    elif IpUtils.is_private_ip(session.get("RemoteEndPoint")) \
-                            and session.get("NowPlayingItem", {}).get("MediaType") == "Video":
-                        media_streams = session.get("NowPlayingItem", {}).get("MediaStreams") or []
-                        for media_stream in media_streams:
-                            total_bit_rate_down += int(media_stream.get("BitRate") or 0)
-            elif service.type == "plex":
-                _plex = service.instance.get_plex()
-                if _plex:
-                    sessions = _plex.sessions()
-                    for session in sessions:
-                        bitrate = sum([m.bitrate or 0 for m in session.media])
-                        total_bit_rate += int(bitrate or 0)
-                        playing_sessions_up.append({
-                            "type": session.TAG,
-                            "bitrate": bitrate,
-                            "address": session.player.address
-                        })
-                    # 计算有效比特率
-                    for session in playing_sessions_up:
-                        # 设置了不限速范围则判断session ip是否在不限速范围内
-                        if self._unlimited_ips["ipv4"] or self._unlimited_ips["ipv6"]:
-                            if not self.__allow_access(self._unlimited_ips, session.get("address")) \
-                                    and session.get("type") == "Video":
-                                total_bit_rate_up += int(session.get("bitrate") or 0)
-                        # 未设置不限速范围，则默认不限速内网ip
-                        elif not IpUtils.is_private_ip(session.get("address")) \
-                                and session.get("type") == "Video":
-                            total_bit_rate_up += int(session.get("bitrate") or 0)
-        self._playing_items = playing_items
-        self._total_bit_rate_up = total_bit_rate_up
-        self._total_bit_rate_down = total_bit_rate_down
-        self._total_bit_rate = total_bit_rate
-
-        if total_bit_rate_up or total_bit_rate_down:
-            # 开启智能限速计算上传限速
-            if self._auto_limit:
-                play_up_speed = self.__calc_limit(total_bit_rate_up, is_up=True)
-                play_down_speed = self.__calc_limit(total_bit_rate_down, is_up=False)
-            else:
-                play_up_speed = self._play_up_speed
-                play_down_speed = self._play_down_speed
+                    logger.error(f"解析媒体服务器 {server} 播放会话失败：{str(e)}")
+            if now - self._reconciled_at.get(server, 0) > self._session_grace:
+                with self._session_lock:
+                    self._session_table.pop(server, None)
+
+    def __apply_event(self, event_data: WebhookEventInfo):
+        """
+        按播放事件增量更新会话表
+        """
+        media_servers = self.media_servers
+        server = event_data.server_name
+        if server not in media_servers:
+            # 无法确定来源服务器，下次评估时重新查询全部媒体服务器
+            with self._session_lock:
+                self._dirty_servers.update(media_servers)
+            return
+        record = PlayingSession.from_event(event_data)
+        with self._session_lock:
+            table = self._session_table.setdefault(server, {})
+            matched = [key for key, session in table.items() if session.same_as(record)]
+            for key in matched:
+                table.pop(key)
+            if event_data.event in ["playback.start", "PlaybackStart", "media.play"]:
+                table[record.key] = record
+                if not record.bitrate or record.path is None:
+                    # 事件中没有码率或路径，需要查询该服务器
+                    self._dirty_servers.add(server)
+            elif not matched:
+                # 会话表中找不到停止的会话，需要查询该服务器
+                self._dirty_servers.add(server)
 
-            # 当前正在播放，开始限速
-            self.__set_limiter(upload_limit=play_up_speed,
-                               download_limit=play_down_speed)
+    def __schedule_evaluation(self):
+        """
+        合并窗口内的播放事件，窗口结束时评估一次限速
+        """
+        if self._event_window <= 0:
+            self.__evaluate_events()
+            return
+        with self._evaluation_lock:
+            if self._evaluation_timer:
+                # 已有待执行的评估，合并
+                return
+            self._evaluation_timer = threading.Timer(self._event_window, self.__evaluate_events)
+            self._evaluation_timer.daemon = True
+            self._evaluation_timer.start()
+
+    def __evaluate_events(self):
+        with self._evaluation_lock:
+            self._evaluation_timer = None
+        media_servers = self.media_servers
+        with self._session_lock:
+            dirty = {server: media_servers[server] for server in self._dirty_servers if server in media_servers}
+        if dirty:
+            self.__reconcile(dirty)
+        self.__evaluate()
+
+    @staticmethod
+    def __fetch_sessions(service: ServiceInfo) -> list:
+        """
+        查询媒体服务器播放中会话
+        """
+        if service.type == "emby":
+            res = service.instance.get_data("[HOST]emby/Sessions?api_key=[APIKEY]")
+        elif service.type == "jellyfin":
+            res = service.instance.get_data("[HOST]Sessions?api_key=[APIKEY]")
+        elif service.type == "plex":
+            _plex = service.instance.get_plex()
+            return _plex.sessions() if _plex else []
         else:
-            if self._auto_limit:
-                noplay_up_speed = int(self._bandwidth_up / 8 / 1024)
-                noplay_down_speed = int(self._bandwidth_down / 8 / 1024)
-            else:
-                # 当前没有播放，取消限速
-                noplay_up_speed = self._noplay_up_speed
-                noplay_down_speed = self._noplay_down_speed
+            return []
+        if not res or res.status_code != 200:
+            raise IOError(f"状态码：{res.status_code if res is not None else '无响应'}")
+        return res.json()
 
-            self.__set_limiter(upload_limit=noplay_up_speed,
-                               download_limit=noplay_down_speed)
+    def __timed_fetch(self, server: str, service: ServiceInfo) -> list:
+        start = time.perf_counter()
+        try:
+            return self.__fetch_sessions(service)
+        finally:
+            self._server_latency[server] = round((time.perf_counter() - start) * 1000, 1)
+
+    def __poll_sessions(self, media_servers: Dict[str, ServiceInfo]) -> Dict[str, list]:
+        """
+        并发查询媒体服务器，只返回本次查询成功的服务器
+        """
+        if not self._poll_executor:
+            return {}
+        futures: Dict[str, Future] = {}
+        for server, service in media_servers.items():
+            pending = self._polling.get(server)
+            if pending and not pending.done():
+                # 上次查询尚未返回，不重复提交
+                continue
+            try:
+                futures[server] = self._poll_executor.submit(self.__timed_fetch, server, service)
+            except RuntimeError:
+                # 服务已停止
+                return {}
+            self._polling[server] = futures[server]
+        if futures:
+            wait(futures.values(), timeout=self._poll_timeout)
+        results = {}
+        for server in media_servers:
+            future = futures.get(server)
+            if future and future.done() and not future.exception():
+                results[server] = future.result()
+            elif future and future.done():
+                logger.error(f"获取媒体服务器 {server} 播放会话失败：{str(future.exception())}")
+                self.__record_error("mediaserver", server, f"获取播放会话失败：{str(future.exception())}")
+            else:
+                logger.warning(f"获取媒体服务器 {server} 播放会话超时，本次跳过")
+                self.__record_error("mediaserver", server, "获取播放会话超时")
+        logger.debug(f"媒体服务器查询耗时：{self._server_latency}")
+        return results
 
     def __delayed_notification(self):
         """执行延迟通知"""
@@ -779,58 +2184,80 @@ class SpeedLimiterMod(_PluginBase):
             notify_state = '[-] '
         return f"{notify_state}{notify_title}{notify_tip_up}{notify_tip_down}\n"
 
-    def __get_media_info(self, session: dict, type: str) -> dict:
+    def __account_sessions(self, sessions: List[PlayingSession]) -> Tuple[int, int, int]:
         """
-        获取媒体信息
+        一次遍历计算总比特率与需要限速的上行、下行比特率
         """
-        media_info = {}
-        user = session.get("UserName", "")
-        item = session.get("NowPlayingItem", {})
-        series_name = item.get('SeriesName', '')
-        media_type = item.get('MediaType', '')
-        if media_type == "Video":
-            if series_name:
-                title = f"{series_name} S{item.get('ParentIndexNumber', 0)}E{item.get('IndexNumber', 0)} {item.get('Name', '')}"
+        total_bit_rate = total_bit_rate_up = total_bit_rate_down = 0
+        classifier = self._address_classifier
+        matcher = self._path_matcher
+        for session in sessions:
+            if session.paused:
+                continue
+            total_bit_rate += session.bitrate
+            if session.media_type != "Video":
+                continue
+            if session.path is None:
+                is_up = True
             else:
-                title = f"{item.get('Name', '')} ({item.get('ProductionYear', 0)})"
-            # path = item.get("Path", "")
-            if type == "emby":
-                bitrate = round(int(item.get("Bitrate") or 0)/10**6, 1)
-            elif type == "jellyfin":
-                media_streams = item.get("MediaStreams", [])
-                bitrate = 0
-                for media_stream in media_streams:
-                    bitrate += int(media_stream.get("BitRate") or 0)/10**6
-                bitrate = round(bitrate, 1)
-            media_info = {
-                "user": user,
-                "title": title,
-                'bitrate': f"{bitrate} Mbps",
-            }
-        return media_info
+                direction = matcher.match(session.path)
+                if not direction:
+                    continue
+                is_up = direction == PathMatcher.UP
+            verdict = classifier.classify(session.address)
+            if classifier.configured:
+                # 设置了不限速范围则判断session ip是否在不限速范围内
+                limited = verdict != AddressClassifier.UNLIMITED
+            elif is_up:
+                # 未设置不限速范围，上行默认不限速内网ip
+                limited = verdict == AddressClassifier.LIMITED
+            else:
+                # 未设置不限速范围，下行默认限速内网ip
+                limited = verdict == AddressClassifier.PRIVATE
+            if not limited:
+                continue
+            if is_up:
+                total_bit_rate_up += session.bitrate
+            else:
+                total_bit_rate_down += session.bitrate
+        return total_bit_rate, total_bit_rate_up, total_bit_rate_down
 
-    def __path_included(self, path: str, is_up: bool) -> bool:
+    def __smooth_bit_rate(self, direction: str, bit_rate: float) -> float:
         """
-        判断是否在限速路径内
+        码率上升立即跟随，下降时按EWMA缓慢回落
         """
-        if is_up:
-            if self._include_path_up:
-                include_paths = self._include_path_up.split("\n")
-                for include_path_up in include_paths:
-                    if include_path_up in path:
-                        # logger.info(f"{path} 在限速路径：{include_path_up} 内，限速")
-                        return True
-            return False
+        smoothed = self._smoothed_bit_rate.get(direction) or 0
+        if bit_rate >= smoothed:
+            smoothed = bit_rate
         else:
-            if self._include_path_down:
-                include_paths = self._include_path_down.split("\n")
-                for include_path_down in include_paths:
-                    if include_path_down in path:
-                        # logger.info(f"{path} 在限速路径：{include_path_down} 内，限速")
-                        return True
-            return False
-        # 
-    
+            smoothed += self._smoothing * (bit_rate - smoothed)
+            # 回落到最小调整量以内时归零
+            if not bit_rate and smoothed / 8 / 1024 < self._min_change:
+                smoothed = 0
+        self._smoothed_bit_rate[direction] = smoothed
+        return smoothed
+
+    def __hold_limit(self, upload_limit: float, download_limit: float) -> Tuple[float, float]:
+        """
+        收紧限速立即生效；放宽限速需变化超过最小调整量且距上次调整超过最短保持时间，否则保持当前限速
+        """
+        now = time.time()
+        applied = self._applied_limit or (upload_limit, download_limit)
+        dwelled = self._applied_limit is None or now - self._limit_changed_at >= self._dwell
+        limits = []
+        for new, old in zip((upload_limit, download_limit), applied):
+            # 0 表示不限速
+            if new and (not old or new < old):
+                limits.append(new)
+            elif dwelled and (bool(new) != bool(old) or abs(new - old) >= self._min_change):
+                limits.append(new)
+            else:
+                limits.append(old)
+        limits = tuple(limits)
+        if limits != self._applied_limit:
+            self._applied_limit, self._limit_changed_at = limits, now
+        return limits
+
     def __calc_limit(self, total_bit_rate: float, is_up: bool) -> float:
         """
         计算智能上传限速
@@ -867,7 +2294,9 @@ class SpeedLimiterMod(_PluginBase):
                 for item in self._playing_items:
                     if item.get('title'):
                         notify_text_playing += f"{index}. {item.get('title')}\n"
-                        notify_text_playing += f"    用户：{item.get('user')} | 码率：{item.get('bitrate')}\n\n"
+                        bitrate_source = {PlayingSession.TRANSCODE: "（转码）",
+                                          PlayingSession.BANDWIDTH: "（实测）"}.get(item.get('bitrate_source'), "")
+                        notify_text_playing += f"    用户：{item.get('user')} | 码率：{item.get('bitrate')}{bitrate_source}\n\n"
                         index += 1
 
             if self._notify_link:
@@ -891,54 +2320,18 @@ class SpeedLimiterMod(_PluginBase):
         """
         设置限速
         """
-        if not self.service_infos:
+        service_infos = self.service_infos
+        if not service_infos:
             return
         state = f"U:{upload_limit},D:{download_limit}"
-        if self._current_state == state:
-            if self._notify_title:
-                self.__schedule_notification()
-            # 限速状态没有改变
-            return
-        else:
-            self._current_state = state
-            
-        try:
-            cnt = 0
-            upload_limit_final = None
-            download_limit_final = None
+        # 本次检查等待下载器接口的截止时间，避免长时间占用限速锁
+        deadline = time.monotonic() + self._apply_timeout
+        allocations = self.__allocate(service_infos, upload_limit, download_limit, deadline)
+        if self._limit_state != state or self.__allocation_changed(allocations):
+            self._limit_state = state
+            self._allocations = allocations
             self._notify_text_speed = "═══ 限速状态 ═══\n\n"
-            for download in self._downloader:
-                service = self.service_infos.get(download)
-                # if self._auto_limit and limit_type == "播放":
-                if self._auto_limit:
-                    # 开启了播放智能限速
-                    if len(self._downloader) == 1:
-                        # 只有一个下载器
-                        upload_limit_final = int(upload_limit)
-                        download_limit_final = int(download_limit)
-                    else:
-                        # 多个下载器
-                        if not self._allocation_ratio_up or not self._allocation_ratio_down:
-                            # 平均
-                            upload_limit_final = int(upload_limit / len(self._downloader))
-                            download_limit_final = int(download_limit / len(self._downloader))
-                        else:
-                            # 按比例
-                            # 定义常用的分隔符
-                            separators = r'[:：,，;；\s\-\|\./]'
-                            allocation_count_up = sum([int(i) for i in re.split(separators, self._allocation_ratio_up)])
-                            weight_up = int(re.split(separators, self._allocation_ratio_up)[cnt])
-                            if weight_up == 0:
-                                upload_limit_final = 0
-                            else:
-                                upload_limit_final = int(upload_limit * weight_up / allocation_count_up)
-                            allocation_count_down = sum([int(i) for i in re.split(separators, self._allocation_ratio_down)])
-                            weight_down = int(re.split(separators, self._allocation_ratio_down)[cnt])
-                            if weight_down == 0:
-                                download_limit_final = 0
-                            else:
-                                download_limit_final = int(download_limit * weight_down / allocation_count_down)
-                            cnt += 1
+            for download, (upload_limit_final, download_limit_final) in allocations.items():
                 if upload_limit_final:
                     text_speed = f"⇡ {round(upload_limit_final/1024,1)}"
                 else:
@@ -948,55 +2341,168 @@ class SpeedLimiterMod(_PluginBase):
                 else:
                     text_speed = f"{text_speed} ⇣ ∞  MiB/s"
                 self._notify_text_speed += f"{download} {text_speed}\n"
-                if service.type == 'qbittorrent':
-                    service.instance.set_speed_limit(download_limit=download_limit_final, upload_limit=upload_limit_final)
-                else:
-                    upload_limit_final = upload_limit_final if upload_limit_final > 0 else -1
-                    download_limit_final = download_limit_final if download_limit_final > 0 else -1
-                    service.instance.set_speed_limit(download_limit=download_limit_final, upload_limit=upload_limit_final)
-            
-            if self._notify_title:
-                self.__schedule_notification()
 
-        except Exception as e:
-            logger.error(f"设置限速失败：{str(e)}")
+        # 上次超时的设置已完成时记录结果
+        for name, (future, limits) in list(self._applying.items()):
+            if future.done():
+                self._applying.pop(name)
+                if not future.cancelled() and not future.exception():
+                    self._current_state[name] = limits
+                    self._apply_errors.pop(name, None)
+        # 只设置与实际生效值不一致的下载器，失败的下次检查时重试
+        pending = {name: limits for name, limits in self._allocations.items()
+                   if name in service_infos and self._current_state.get(name) != limits}
+        if pending:
+            self.__apply_limits(service_infos, pending, deadline)
+
+        if self._notify_title:
+            self.__schedule_notification()
+
+    def __apply_limits(self, service_infos: Dict[str, ServiceInfo], pending: Dict[str, Tuple[int, int]],
+                       deadline: float):
+        """
+        并发设置下载器限速，截止时间前未完成的下次检查时处理
+        """
+        if not self._apply_executor:
+            return
+        futures: Dict[str, Future] = {}
+        for name, (upload_limit, download_limit) in pending.items():
+            if name in self._applying:
+                # 上次设置尚未返回，不重复提交
+                continue
+            try:
+                futures[name] = self._apply_executor.submit(self.__apply_limit, service_infos[name],
+                                                            upload_limit, download_limit)
+            except RuntimeError:
+                # 服务已停止
+                return
+            self._applying[name] = (futures[name], pending[name])
+        if not futures:
+            return
+        wait(futures.values(), timeout=max(deadline - time.monotonic(), 0))
+        for name, future in futures.items():
+            if future.done():
+                self._applying.pop(name, None)
+            if not future.done():
+                self._apply_errors[name] = "设置超时"
+                self.__record_error("downloader", name, "设置限速超时")
+                logger.warning(f"下载器 {name} 设置限速超时，下次检查时重试")
+            elif future.exception():
+                self._apply_errors[name] = str(future.exception())
+                self.__record_error("downloader", name, f"设置限速失败：{str(future.exception())}")
+                logger.error(f"下载器 {name} 设置限速失败：{str(future.exception())}，下次检查时重试")
+            else:
+                self._current_state[name] = pending[name]
+                self._apply_errors.pop(name, None)
 
     @staticmethod
-    def __allow_access(allow_ips: dict, ip: str) -> bool:
+    def __apply_limit(service: ServiceInfo, upload_limit: int, download_limit: int):
+        """
+        设置单个下载器限速，支持时读回校验
+        """
+        if service.type == 'qbittorrent':
+            result = service.instance.set_speed_limit(download_limit=download_limit, upload_limit=upload_limit)
+        else:
+            result = service.instance.set_speed_limit(download_limit=download_limit if download_limit > 0 else -1,
+                                                      upload_limit=upload_limit if upload_limit > 0 else -1)
+        if result is False:
+            raise IOError("下载器返回失败")
+        if not hasattr(service.instance, "get_speed_limit"):
+            return
+        applied = service.instance.get_speed_limit()
+        if not applied:
+            return
+        # get_speed_limit 返回 (下载, 上传)，不限速时各下载器返回值不统一，不做校验
+        for target, value in ((download_limit, applied[0]), (upload_limit, applied[1])):
+            if target > 0 and value is not None and abs(float(value) - target) > 1:
+                raise IOError(f"读回限速 {applied[1]}/{applied[0]} 与设置值 {upload_limit}/{download_limit} 不一致")
+
+    def __allocation_changed(self, allocations: Dict[str, Tuple[int, int]]) -> bool:
         """
-        判断IP是否合法
-        :param allow_ips: 充许的IP范围 {"ipv4":, "ipv6":}
-        :param ip: 需要检查的ip
+        下载器变化，或任一限速变化超过最小调整量
         """
-        if not allow_ips:
+        if allocations.keys() != self._allocations.keys():
             return True
-        try:
-            ipaddr = ipaddress.ip_address(ip)
-            if ipaddr.version == 4:
-                if not allow_ips.get('ipv4'):
-                    return True
-                allow_ipv4s = allow_ips.get('ipv4').split(",")
-                for allow_ipv4 in allow_ipv4s:
-                    if ipaddr in ipaddress.ip_network(allow_ipv4, strict=False):
-                        return True
-            elif ipaddr.ipv4_mapped:
-                if not allow_ips.get('ipv4'):
-                    return True
-                allow_ipv4s = allow_ips.get('ipv4').split(",")
-                for allow_ipv4 in allow_ipv4s:
-                    if ipaddr.ipv4_mapped in ipaddress.ip_network(allow_ipv4, strict=False):
-                        return True
-            else:
-                if not allow_ips.get('ipv6'):
+        for name, limits in allocations.items():
+            for new, old in zip(limits, self._allocations[name]):
+                if bool(new) != bool(old) or abs(new - old) >= self._min_change:
                     return True
-                allow_ipv6s = allow_ips.get('ipv6').split(",")
-                for allow_ipv6 in allow_ipv6s:
-                    if ipaddr in ipaddress.ip_network(allow_ipv6, strict=False):
-                        return True
-        except Exception as err:
-            print(str(err))
-            return False
         return False
 
+    def __allocate(self, service_infos: Dict[str, ServiceInfo],
+                   upload_limit: float, download_limit: float, deadline: float) -> Dict[str, Tuple[int, int]]:
+        """
+        计算各下载器限速 {下载器: (上行, 下行)}
+        """
+        downloaders = [name for name in self._downloader if service_infos.get(name)]
+        if not self._auto_limit:
+            # 固定限速，各下载器使用相同设置
+            return {name: (int(upload_limit or 0), int(download_limit or 0)) for name in downloaders}
+        if len(self._downloader) == 1:
+            return {name: (int(upload_limit), int(download_limit)) for name in downloaders}
+        rates = self.__transfer_rates(service_infos, downloaders, deadline)
+        ups = self._allocators["up"].allocate(
+            upload_limit, {name: rate[0] if rate else None for name, rate in rates.items()},
+            {name: limit[0] for name, limit in self._current_state.items()})
+        downs = self._allocators["down"].allocate(
+            download_limit, {name: rate[1] if rate else None for name, rate in rates.items()},
+            {name: limit[1] for name, limit in self._current_state.items()})
+        return {name: (ups[name], downs[name]) for name in downloaders}
+
+    def __transfer_rates(self, service_infos: Dict[str, ServiceInfo], downloaders: List[str],
+                         deadline: float) -> Dict[str, Optional[Tuple[float, float]]]:
+        """
+        并发读取下载器速率，超时的按未知处理；最多等待 _rate_timeout，为设置限速保留时间
+        """
+        if not self._apply_executor:
+            return {name: None for name in downloaders}
+        try:
+            futures = {name: self._apply_executor.submit(self.__transfer_rate, service_infos[name])
+                       for name in downloaders}
+        except RuntimeError:
+            return {name: None for name in downloaders}
+        wait(futures.values(), timeout=min(self._rate_timeout, max(deadline - time.monotonic(), 0)))
+        return {name: future.result() if future.done() else None for name, future in futures.items()}
+
+    @staticmethod
+    def __transfer_rate(service: ServiceInfo) -> Optional[Tuple[float, float]]:
+        """
+        下载器当前上传、下载速率（KiB/s）
+        """
+        try:
+            info = service.instance.transfer_info()
+        except Exception as e:
+            logger.debug(f"获取下载器 {service.name} 传输速率失败：{str(e)}")
+            return None
+        if not info:
+            return None
+
+        def value(*keys) -> Optional[float]:
+            for key in keys:
+                speed = info.get(key) if isinstance(info, dict) else getattr(info, key, None)
+                if speed is not None:
+                    return float(speed) / 1024
+            return None
+
+        upload_speed = value("up_info_speed", "upload_speed")
+        download_speed = value("dl_info_speed", "download_speed")
+        if upload_speed is None or download_speed is None:
+            return None
+        return upload_speed, download_speed
+
     def stop_service(self):
-        pass
+        """
+        停止服务
+        """
+        if self._history:
+            self.save_data("history", self._history.dump())
+        if self._poll_executor:
+            self._poll_executor.shutdown(wait=False, cancel_futures=True)
+            self._poll_executor = None
+        if self._apply_executor:
+            self._apply_executor.shutdown(wait=False, cancel_futures=True)
+            self._apply_executor = None
+        with self._evaluation_lock:
+            if self._evaluation_timer:
+                self._evaluation_timer.cancel()
+                self._evaluation_timer = None
@@ -0,0 +1,244 @@
+"""
+豆瓣rexxar榜单接口本地替身服务，回放录制数据，可配置延迟与错误率，用于离线测试吞吐与正确性
+
+录制：python tools/doubanstub.py record --data ./recorded movie_top250 movie_weekly_best
+回放：python tools/doubanstub.py serve --data ./recorded --port 8765 --latency 0.2 --error-rate 0.05
+压测：python tools/doubanstub.py bench --data ./recorded --latency 0.2 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, parse_qsl
+
+# 获取引擎不依赖MoviePilot，直接从插件目录导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "plugins.v2" / "doubanrankmod"))
+from fetcher import DoubanAsyncFetcher, DoubanItemParser  # noqa: E402
+
+REXXAR_URL = "https://m.douban.com/rexxar/api/v2/subject_collection/{name}/items?start=0&count={count}&items_only=1&for_mobile=1"
+REFERER_URL = "https://m.douban.com/subject_collection/{name}"
+USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148"
+
+
+def load_recorded(data_dir: Path) -> Dict[str, list]:
+    """
+    读取录制数据，文件名为榜单ID，内容为rexxar响应或条目列表
+    """
+    collections = {}
+    for file in sorted(data_dir.glob("*.json")):
+        data = json.loads(file.read_text(encoding="utf-8"))
+        collections[file.stem] = data if isinstance(data, list) else data.get("subject_collection_items") or []
+    return collections
+
+
+class DoubanStubServer:
+    """
+    回放录制的榜单数据，按 start/count 分页
+    """
+
+    def __init__(self, collections: Dict[str, list], host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0, jitter: float = 0, error_rate: float = 0, seed: Optional[int] = None):
+        self.collections = collections
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self.__handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    delay = stub.latency + stub._random.uniform(0, stub.jitter)
+                    failed = stub._random.random() < stub.error_rate
+                    if failed:
+                        stub.errors += 1
+                time.sleep(delay)
+                parts = urlsplit(self.path)
+                segments = [s for s in parts.path.split("/") if s]
+                # /rexxar/api/v2/subject_collection/<name>/items
+                name = segments[-2] if len(segments) >= 2 and segments[-1] == "items" else None
+                if failed:
+                    return self.__reply(500, {"msg": "stub error"})
+                if name not in stub.collections:
+                    return self.__reply(404, {"msg": "not found"})
+                query = dict(parse_qsl(parts.query))
+                start = int(query.get("start") or 0)
+                count = int(query.get("count") or 20)
+                items = stub.collections[name]
+                self.__reply(200, {
+                    "count": len(items[start:start + count]),
+                    "start": start,
+                    "total": len(items),
+                    "subject_collection_items": items[start:start + count]
+                })
+
+            def __reply(self, status: int, body: dict):
+                content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "DoubanStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def urllib_get(url: str, referer: str) -> Optional[bytes]:
+    """
+    同步请求，未安装httpx时供异步引擎使用
+    """
+    request = urllib.request.Request(url, headers={"Referer": referer, "User-Agent": USER_AGENT})
+    try:
+        with urllib.request.urlopen(request, timeout=20) as res:
+            return res.read()
+    except Exception:
+        return None
+
+
+def record(data_dir: Path, names: List[str], count: int):
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        content = urllib_get(REXXAR_URL.format(name=name, count=count), REFERER_URL.format(name=name))
+        if not content:
+            print(f"{name}: 获取失败")
+            continue
+        items = json.loads(content).get("subject_collection_items") or []
+        (data_dir / f"{name}.json").write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+        print(f"{name}: {len(items)} 条")
+
+
+def bench_parse(collections: Dict[str, list], rounds: int = 20):
+    """
+    对比整体解析与增量解析的峰值内存和耗时
+    """
+    for name, items in collections.items():
+        body = json.dumps({"subject_collection_items": items}, ensure_ascii=False).encode("utf-8")
+        results = {}
+        for label, parse in [
+            ("整体解析", lambda: json.loads(body.decode("utf-8")).get("subject_collection_items")),
+            ("增量解析", lambda: DoubanItemParser.parse(DoubanItemParser.chunks(body)))
+        ]:
+            tracemalloc.start()
+            parse()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                parse()
+            results[label] = (round(peak / 1024), round((time.perf_counter() - start) / rounds * 1000, 2))
+        print(f"{name}（{round(len(body) / 1024)} KB）：" + "，".join(
+            f"{label} 峰值 {peak} KB 耗时 {elapsed} 毫秒" for label, (peak, elapsed) in results.items()))
+
+
+def bench(collections: Dict[str, list], latency: float, jitter: float, error_rate: float,
+          page_size: int, concurrency: int, retries: int, seed: Optional[int]):
+    """
+    对比顺序获取与异步引擎的耗时，并校验返回条目
+    """
+    addrs = [{
+        "value": name,
+        "referer": REFERER_URL.format(name=name),
+        "address": REXXAR_URL.format(name=name, count=max(len(items), 1))
+    } for name, items in collections.items()]
+
+    stub = DoubanStubServer(collections, latency=latency, jitter=jitter, error_rate=error_rate, seed=seed).start()
+    try:
+        # 顺序获取，一个榜单一个请求
+        sequential = DoubanAsyncFetcher(page_size=10 ** 6, concurrency=1, retries=retries,
+                                        base_url=stub.base_url, blocking_get=urllib_get)
+        sequential_stats = sequential.run(addrs, lambda *args: None)
+
+        results = {}
+        fetcher = DoubanAsyncFetcher(page_size=page_size, concurrency=concurrency, retries=retries,
+                                     base_url=stub.base_url, blocking_get=urllib_get)
+        stats = fetcher.run(addrs, lambda addr, items, error: results.update({addr.get("value"): (items, error)}))
+    finally:
+        stub.stop()
+
+    mismatched = [name for name, (items, error) in results.items()
+                  if not error and [i.get("id") for i in items] != [i.get("id") for i in collections[name]]]
+    failed = [name for name, (_, error) in results.items() if error]
+    total_items = sum(len(items) for items, _ in results.values())
+    print(f"顺序获取：{sequential_stats['elapsed']} 秒，请求 {sequential_stats['requests']} 次")
+    print(f"异步引擎：{stats['elapsed']} 秒，请求 {stats['requests']} 次，错误 {stats['errors']} 次，"
+          f"{round(total_items / stats['elapsed'], 1) if stats['elapsed'] else 0} 条/秒")
+    print(f"榜单 {len(results)} 个，失败 {failed or '无'}，数据不一致 {mismatched or '无'}")
+    bench_parse(collections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="豆瓣榜单接口本地替身服务")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command in ["record", "serve", "bench"]:
+        p = sub.add_parser(command)
+        p.add_argument("--data", type=Path, required=True, help="录制数据目录")
+        if command == "record":
+            p.add_argument("names", nargs="+", help="榜单ID")
+            p.add_argument("--count", type=int, default=250)
+            continue
+        p.add_argument("--latency", type=float, default=0.2, help="响应延迟（秒）")
+        p.add_argument("--jitter", type=float, default=0, help="随机附加延迟上限（秒）")
+        p.add_argument("--error-rate", type=float, default=0, help="返回500的概率")
+        p.add_argument("--seed", type=int, default=None)
+        if command == "serve":
+            p.add_argument("--host", default="127.0.0.1")
+            p.add_argument("--port", type=int, default=8765)
+        else:
+            p.add_argument("--page-size", type=int, default=50)
+            p.add_argument("--concurrency", type=int, default=6)
+            p.add_argument("--retries", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.data, args.names, args.count)
+    elif args.command == "serve":
+        stub = DoubanStubServer(load_recorded(args.data), host=args.host, port=args.port, latency=args.latency,
+                                jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+        print(f"豆瓣替身服务：{stub.base_url}，榜单：{', '.join(stub.collections)}")
+        stub.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            stub.stop()
+    else:
+        bench(load_recorded(args.data), args.latency, args.jitter, args.error_rate,
+              args.page_size, args.concurrency, args.retries, args.seed)
+
+
+if __name__ == "__main__":
+    main()